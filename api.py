@@ -1,15 +1,44 @@
-from fastapi import FastAPI, UploadFile
+from fastapi import FastAPI, UploadFile, Response, Query, Form, Path
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 import uvicorn
-from pydantic import BaseModel
-from store import RedisStore
-from model import GroqService, GPTAssistant
+import asyncio
+import math
+import time
+import json
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from store import RedisStore, HistoryWriter, telemetry
+from model import GroqService, GPTAssistant, TokenUsage, ConversationMemory, Overloaded
+
+# Redis keys of a conversation are chat:{id} and chat:{id}:summary, an id with
+# a colon could read or overwrite another conversation's keys
+CONVERSATION_ID_PATTERN = r"^[^:]{1,128}$"
+# X-Next-Cursor values: the timestamp and id of the oldest entry already returned
+HISTORY_CURSOR_PATTERN = r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\|[0-9a-f-]{36}$"
 
 class ChatRequest(BaseModel):
     message: str
+    # Continues the conversation stored under chat:{conversation_id}
+    conversation_id: Optional[str] = Field(None, pattern=CONVERSATION_ID_PATTERN)
 
-app = FastAPI()
 redis = RedisStore()
+history_writer = HistoryWriter(redis)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    history_writer.start()
+    if gpt_assistant.index:
+        gpt_assistant.index.start()
+    yield
+    # Flush queued history before the shared clients go away
+    await history_writer.close()
+    await gpt_assistant.aclose()
+    await redis.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,28 +46,201 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browsers hide response headers from scripts unless they are listed here
+    expose_headers=["X-Next-Cursor", "X-Token-Usage", "Server-Timing"],
 )
 
-gpt_assistant = GPTAssistant()
-groq_service = GroqService()
+@app.middleware("http")
+async def server_timing(request, call_next):
+    trace, token = telemetry.begin_request()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        telemetry.end_request(token)
+    # Streaming responses are timed until their headers, the stream itself shows up in the stage spans
+    duration = time.perf_counter() - start
+    route = request.scope.get("route")
+    telemetry.observe_request(request.method, route.path if route else "unmatched", response.status_code, duration)
+    response.headers["Server-Timing"] = trace.server_timing(duration)
+    return response
+
+@app.exception_handler(Overloaded)
+async def overloaded(request, exc: Overloaded):
+    # The upstream quota is exhausted for longer than a client should wait, tell it when to come back
+    return JSONResponse(
+        {"detail": "Hệ thống đang quá tải, vui lòng thử lại sau."},
+        status_code=503,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+gpt_assistant = GPTAssistant(redis=redis.redis)
+groq_service = GroqService(redis=redis.redis)
+memory = ConversationMemory(redis, gpt_assistant)
+background_tasks = set()
+
+def run_in_background(coro):
+    # Keep a reference so the task is not garbage collected before it finishes
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = telemetry.metrics()
+    return Response(body, media_type=content_type)
+
+@app.get("/stats")
+async def stats():
+    return {
+        "tool_cache": {**gpt_assistant.cache.stats, "size": len(gpt_assistant.cache)} if gpt_assistant.cache else None,
+        "catalog": gpt_assistant.catalog.stats,
+        "catalog_index": {
+            **gpt_assistant.index.stats,
+            "entries": len(gpt_assistant.index.entries),
+            "synced_at": gpt_assistant.index.synced_at,
+        } if gpt_assistant.index else None,
+        "single_flight": {
+            "tools": gpt_assistant.tool_flights.stats,
+            "chat": gpt_assistant.chat_flights.stats if gpt_assistant.chat_flights else None,
+        },
+        "router": gpt_assistant.router.stats if gpt_assistant.router else None,
+        "tool_prefetch": {
+            **gpt_assistant.prefetcher.stats,
+            "hit_rate": gpt_assistant.prefetcher.hit_rate,
+        } if gpt_assistant.prefetcher else None,
+        "answer_cache": {
+            **gpt_assistant.answers.stats,
+            "size": len(gpt_assistant.answers.cache),
+            "hit_rate": gpt_assistant.answers.hit_rate,
+            "similar_match": gpt_assistant.answers.similar_match,
+        } if gpt_assistant.answers else None,
+        "tokens": {"prompt_mode": gpt_assistant.prompt_mode, **gpt_assistant.usage.as_dict()},
+        "compaction": gpt_assistant.compactor.stats if gpt_assistant.compactor else None,
+        "history_writer": {**history_writer.stats, "queued": history_writer.queue.qsize()},
+        "llm_providers": {
+            **gpt_assistant.providers.stats,
+            **{provider.name: provider.snapshot() for provider in gpt_assistant.providers.providers},
+        },
+        "transcription_scheduler": groq_service.scheduler.snapshot(),
+        "transcription": groq_service.stats,
+        "transcript_cache": {
+            **groq_service.cache.stats,
+            "size": len(groq_service.cache),
+            "hit_rate": groq_service.cache.hit_rate,
+        } if groq_service.cache else None,
+    }
+
+async def history_page(response: Response, id: Optional[str], cursor: Optional[str], limit: Optional[int],
+                       since: Optional[datetime], until: Optional[datetime]):
+    """The whole history without paging parameters, as before paging existed.
+
+    Otherwise the newest limit entries older than cursor, oldest first, and
+    X-Next-Cursor names the page before them.
+    """
+    if cursor is None and limit is None and since is None and until is None:
+        return await (redis.get_history_by_id(id) if id else redis.get_history())
+    entries, next_cursor = await redis.get_history_page(id, cursor, limit or 50, since, until)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return entries
 
 @app.get("/history")
-async def root():
-    return redis.get_history()
+async def root(response: Response, cursor: Optional[str] = Query(None, pattern=HISTORY_CURSOR_PATTERN),
+               limit: Optional[int] = Query(None, ge=1, le=500),
+               since: Optional[datetime] = None, until: Optional[datetime] = None):
+    return await history_page(response, None, cursor, limit, since, until)
+
+@app.get("/history/export")
+async def export_history(id: Optional[str] = Query(None, pattern=CONVERSATION_ID_PATTERN), since: Optional[datetime] = None, until: Optional[datetime] = None):
+    async def lines():
+        async for entry in redis.iter_history(id, since, until):
+            yield json.dumps(entry, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @app.get("/history/{id}")
-async def get_history_by_id(id: str):
-    return redis.get_history_by_id(id)
+async def get_history_by_id(response: Response, id: str = Path(pattern=CONVERSATION_ID_PATTERN),
+                            cursor: Optional[str] = Query(None, pattern=HISTORY_CURSOR_PATTERN),
+                            limit: Optional[int] = Query(None, ge=1, le=500),
+                            since: Optional[datetime] = None, until: Optional[datetime] = None):
+    return await history_page(response, id, cursor, limit, since, until)
 
 @app.post("/api/transcribe")
 async def transcribe_audio(file: UploadFile):
     return await groq_service.speech_to_text(file)
 
 @app.post("/api/chat")
-async def chat_with_ai(request: ChatRequest):
-    response = gpt_assistant.process_message(request.message)
-    redis.save_history(request.message, response.choices[0].message.content)
+async def chat_with_ai(request: ChatRequest, http_response: Response):
+    usage = TokenUsage()
+    history = await memory.context(request.conversation_id) if request.conversation_id else None
+    response = await gpt_assistant.process_message(request.message, usage, history)
+    written = await history_writer.save(request.message, response.choices[0].message.content, request.conversation_id)
+    if request.conversation_id:
+        run_in_background(memory.update(request.conversation_id, written))
+    http_response.headers["X-Token-Usage"] = usage.header()
     return response.choices[0].message.content
 
+async def answer_events(message: str, conversation_id: Optional[str], history: Optional[list]):
+    """Server-sent events with the streamed answer, saving the exchange once it ends"""
+    answer = []
+    try:
+        async for content in gpt_assistant.stream_message(message, history=history):
+            answer.append(content)
+            yield f"data: {json.dumps(content, ensure_ascii=False)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    except Exception as e:
+        telemetry.log("chat_stream_failed", "error", error=str(e))
+        yield f"event: error\ndata: {json.dumps(str(e), ensure_ascii=False)}\n\n"
+    finally:
+        # Runs on completion and on client disconnect; enqueueing from a task keeps
+        # the write alive when the response itself is being cancelled
+        if answer:
+            run_in_background(save_exchange(message, "".join(answer), conversation_id))
+
+async def save_exchange(message: str, answer: str, conversation_id: Optional[str]):
+    """Queue the exchange for the history, then summarize once it is stored"""
+    written = await history_writer.save(message, answer, conversation_id)
+    if conversation_id:
+        await memory.update(conversation_id, written)
+
+def event_stream(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/chat/stream")
+async def chat_with_ai_stream(request: ChatRequest):
+    history = await memory.context(request.conversation_id) if request.conversation_id else None
+    return event_stream(answer_events(request.message, request.conversation_id, history))
+
+@app.post("/api/voice")
+async def voice_chat(file: UploadFile, conversation_id: Optional[str] = Form(None, pattern=CONVERSATION_ID_PATTERN)):
+    # The upload is read up front, the multipart body is gone once the stream starts
+    contents = await groq_service.read_audio(file)
+    # Conversation context loads while the audio is being transcribed
+    history = asyncio.create_task(memory.context(conversation_id)) if conversation_id else None
+
+    async def events():
+        try:
+            transcription = await groq_service.transcribe_audio(contents, file.filename)
+        except Overloaded as e:
+            if history:
+                history.cancel()
+            yield f"event: error\ndata: {json.dumps(str(e), ensure_ascii=False)}\n\n"
+            return
+        yield f"event: transcript\ndata: {transcription.model_dump_json()}\n\n"
+        if not transcription.success or not transcription.data.strip():
+            if history:
+                history.cancel()
+            yield f"event: error\ndata: {json.dumps(transcription.error or 'empty transcript', ensure_ascii=False)}\n\n"
+            return
+        async for event in answer_events(transcription.data, conversation_id, await history if history else None):
+            yield event
+
+    return event_stream(events())
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,51 @@
+"""Compare two load reports, flagging endpoints that got slower or lost throughput.
+
+    python -m bench.compare bench-main.json bench-branch.json --threshold 10
+
+Exits with status 1 when any p95, p99 or rps moved the wrong way by more than threshold percent.
+"""
+import sys
+import json
+import argparse
+
+# metric -> whether a higher value is better
+METRICS = {"latency_ms.p50": False, "latency_ms.p95": False, "latency_ms.p99": False, "rps": True, "worker_cpu_percent": False}
+GATED = {"latency_ms.p95", "latency_ms.p99", "rps"}
+
+
+def value(result: dict, metric: str):
+    for part in metric.split("."):
+        result = (result or {}).get(part)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10, help="percent change tolerated")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["endpoints"]
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)["endpoints"]
+
+    regressions = 0
+    for endpoint in sorted(baseline.keys() & candidate.keys()):
+        for metric, higher_is_better in METRICS.items():
+            old, new = value(baseline[endpoint], metric), value(candidate[endpoint], metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change < -args.threshold if higher_is_better else change > args.threshold
+            flag = ""
+            if worse and metric in GATED:
+                regressions += 1
+                flag = "  REGRESSION"
+            print(f"{endpoint:12} {metric:20} {old:10} -> {new:10} ({change:+.1f}%){flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
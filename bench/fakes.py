@@ -0,0 +1,259 @@
+"""Local stand-ins for every upstream of the API, for load tests that spend no quota.
+
+    python -m bench.fakes --llm-latency 0.8 --catalog-error-rate 0.01
+
+Serves, with configurable latency and error rates:
+  - the OpenAI chat completions API of GitHub Models, tool calls and streaming included
+  - the Groq transcription API under /openai/v1
+  - the catalog endpoints used by model/gpt.py
+  - a Redis with RedisJSON (fakeredis) unless --redis-port is 0
+"""
+import time
+import json
+import uuid
+import random
+import asyncio
+import argparse
+import threading
+from fastapi import FastAPI, Request, UploadFile, Form, Response
+from fastapi.responses import StreamingResponse, JSONResponse
+import uvicorn
+from model.catalog import CATEGORY_MAP, SERVICE_MAP
+
+
+class Upstream:
+    """Latency drawn from a log-normal around median seconds, failing with error_rate"""
+
+    def __init__(self, median: float, jitter: float, error_rate: float):
+        self.median = median
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    async def delay(self, scale: float = 1.0) -> None:
+        if self.median > 0:
+            await asyncio.sleep(scale * self.median * random.lognormvariate(0, self.jitter))
+
+    def error(self):
+        """An error response to send instead of the real one, or None"""
+        if random.random() >= self.error_rate:
+            return None
+        if random.random() < 0.5:
+            return JSONResponse({"error": {"message": "rate limited"}}, status_code=429, headers={"Retry-After": "1"})
+        return JSONResponse({"error": {"message": "upstream failure"}}, status_code=503)
+
+
+def catalog_data(ads_per_service: int) -> dict:
+    """A deterministic catalog shaped like the real one, built from the mapping tables"""
+    rng = random.Random(42)
+    categories = [{"categoryName": "Tất cả", "categoryId": 0, "categorySeq": 0}] + [
+        {"categoryName": name, "categoryId": i, "categorySeq": i} for i, (name, _) in enumerate(CATEGORY_MAP, 1)
+    ]
+    services = {}
+    ads = {}
+    advertisement_id = 0
+    for service_id, (service_name, service_code) in enumerate(SERVICE_MAP, 1):
+        category_name, category_code = CATEGORY_MAP[service_id % len(CATEGORY_MAP)]
+        services.setdefault(category_code, []).append(
+            {"serviceName": service_name, "serviceId": service_id, "deliveryAvailable": service_id % 2 == 0}
+        )
+        for i in range(ads_per_service):
+            advertisement_id += 1
+            low = rng.randrange(10, 200) * 1000
+            ads.setdefault(service_code, []).append({
+                "advertisementId": advertisement_id,
+                "mainAdvertisementName": f"{service_name} {i + 1}",
+                "serviceId": service_id,
+                "serviceName": service_name,
+                "categoryName": category_name,
+                "categoryCode": category_code,
+                "description": f"{service_name} chất lượng, phục vụ cư dân chung cư Hưng Ngân. " * rng.randrange(1, 6),
+                "address": f"Block {rng.choice('ABC')}, tầng {rng.randrange(1, 20)}",
+                "phoneNumber": f"09{rng.randrange(10 ** 7, 10 ** 8)}",
+                "priceRangeLow": low,
+                "priceRangeHigh": low * 3,
+                "openingHourStart": "07:00",
+                "openingHourEnd": "22:00",
+                "deliveryAvailable": rng.random() < 0.5,
+                "averageRating": round(rng.uniform(3, 5), 1),
+                "reviewCount": rng.randrange(200),
+                "likes": rng.randrange(500),
+                "views": rng.randrange(5000),
+            })
+    return {"categories": categories, "services": services, "ads": ads}
+
+
+def catalog_app(upstream: Upstream, ads_per_service: int) -> FastAPI:
+    app = FastAPI()
+    data = catalog_data(ads_per_service)
+    all_ads = [ad for ads in data["ads"].values() for ad in ads]
+    by_likes = sorted(all_ads, key=lambda ad: ad["likes"], reverse=True)
+
+    @app.middleware("http")
+    async def latency(request: Request, call_next):
+        await upstream.delay()
+        return upstream.error() or await call_next(request)
+
+    @app.get("/api/v1/categories")
+    async def categories():
+        return {"result": data["categories"]}
+
+    @app.get("/api/v1/main-advertisements/top-food")
+    async def top_food():
+        return {"result": [ad for ad in by_likes if ad["categoryCode"] in ("food", "drinks")][:5]}
+
+    @app.get("/api/v1/advertisement-services/category")
+    async def services(categoryName: str = ""):
+        return {"result": data["services"].get(categoryName, [])}
+
+    @app.get("/api/v1/main-advertisements/top-restaurants")
+    async def top_restaurants(serviceId: int = 0, limit: int = 10):
+        ads = [ad for ad in by_likes if not serviceId or ad["serviceId"] == serviceId]
+        return {"result": ads[:limit]}
+
+    @app.get("/api/v2/main-advertisements/service2")
+    async def service_ads(serviceName: str = ""):
+        return {"result": {"responseList": data["ads"].get(serviceName, [])}}
+
+    @app.get("/api/v2/main-advertisements/top-populars")
+    async def top_populars(categoryName: str = ""):
+        return {"result": [ad for ad in by_likes if ad["categoryCode"] == categoryName][:10]}
+
+    return app
+
+
+def llm_app(chat: Upstream, transcription: Upstream, tool_rate: float) -> FastAPI:
+    app = FastAPI()
+    service_codes = [code for _, code in SERVICE_MAP]
+
+    def usage(body: dict, completion_tokens: int) -> dict:
+        prompt_tokens = len(json.dumps(body.get("messages", []), ensure_ascii=False)) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    def reply(body: dict):
+        """(content, tool_calls) the fake model answers with"""
+        messages = body.get("messages", [])
+        if body.get("tools") and messages and messages[-1]["role"] == "user" and random.random() < tool_rate:
+            arguments = json.dumps({"service_name": random.choice(service_codes)})
+            return None, [{
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": "get_service_advertisements", "arguments": arguments},
+            }]
+        words = "Dạ, bên em có một số dịch vụ phù hợp với anh/chị ạ.".split() * random.randint(4, 12)
+        return " ".join(words), None
+
+    @app.post("/chat/completions")
+    @app.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        if error := chat.error():
+            await chat.delay(0.2)
+            return error
+        content, tool_calls = reply(body)
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": body.get("model", "fake")}
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        completion_tokens = len(content or "") // 4 + 10
+
+        if not body.get("stream"):
+            await chat.delay()
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+                "usage": usage(body, completion_tokens),
+            }
+
+        async def chunks():
+            def chunk(delta: dict, finish_reason=None, **extra) -> str:
+                choices = [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else []
+                return f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': choices, **extra}, ensure_ascii=False)}\n\n"
+
+            # Time to first token is part of the latency, the rest trickles out
+            await chat.delay(0.4)
+            yield chunk({"role": "assistant", "content": ""})
+            if tool_calls:
+                yield chunk({"tool_calls": [{"index": 0, **tool_calls[0]}]})
+            else:
+                pieces = content.split(" ")
+                for piece in pieces:
+                    await chat.delay(0.6 / len(pieces))
+                    yield chunk({"content": piece + " "})
+            yield chunk({}, finish_reason)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk(None, usage=usage(body, completion_tokens))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.post("/openai/v1/audio/transcriptions")
+    async def transcriptions(file: UploadFile, model: str = Form(...), response_format: str = Form("json")):
+        size = len(await file.read())
+        # Roughly proportional to the audio length
+        await transcription.delay(max(1.0, size / 500_000))
+        if error := transcription.error():
+            return error
+        return {"text": "trà sữa nào ngon", "language": "vi", "duration": size / 32000, "segments": []}
+
+    @app.get("/health")
+    async def health():
+        return Response("ok")
+
+    return app
+
+
+def start_redis(port: int) -> None:
+    # Imported here so the HTTP fakes run without the bench extra when a real Redis is used
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+async def serve(args) -> None:
+    llm = llm_app(
+        Upstream(args.llm_latency, args.llm_jitter, args.llm_error_rate),
+        Upstream(args.stt_latency, args.llm_jitter, args.stt_error_rate),
+        args.tool_rate,
+    )
+    catalog = catalog_app(Upstream(args.catalog_latency, args.catalog_jitter, args.catalog_error_rate), args.ads_per_service)
+    servers = [
+        uvicorn.Server(uvicorn.Config(llm, host="127.0.0.1", port=args.llm_port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(catalog, host="127.0.0.1", port=args.catalog_port, log_level="warning")),
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-port", type=int, default=9101)
+    parser.add_argument("--catalog-port", type=int, default=9102)
+    parser.add_argument("--redis-port", type=int, default=9103, help="0 to bring your own Redis")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="median seconds per completion")
+    parser.add_argument("--llm-jitter", type=float, default=0.4, help="log-normal sigma of all LLM latencies")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--tool-rate", type=float, default=0.7, help="share of first turns that call a tool")
+    parser.add_argument("--stt-latency", type=float, default=0.5, help="median seconds per 500 KB of audio")
+    parser.add_argument("--stt-error-rate", type=float, default=0.0)
+    parser.add_argument("--catalog-latency", type=float, default=0.15)
+    parser.add_argument("--catalog-jitter", type=float, default=0.5)
+    parser.add_argument("--catalog-error-rate", type=float, default=0.0)
+    parser.add_argument("--ads-per-service", type=int, default=20)
+    return parser
+
+
+def main() -> None:
+    args = parser().parse_args()
+    if args.redis_port:
+        start_redis(args.redis_port)
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Load generator for the API, reporting latency percentiles, throughput and server CPU as JSON.
+
+    python -m bench.load --url http://127.0.0.1:8000 --pid <server pid> --endpoints chat,history
+
+Each endpoint is loaded on its own for --duration seconds at --concurrency
+so the CPU numbers belong to that endpoint alone.
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import wave
+import random
+import asyncio
+import argparse
+import platform
+from datetime import datetime, timezone
+import httpx
+
+QUESTIONS = [
+    "trà sữa nào ngon", "có quán cà phê nào gần không", "danh sách danh mục", "top món ăn ngon",
+    "giặt ủi ở đâu", "tìm thợ sửa máy lạnh", "quán nhậu bình dân", "có lớp dạy tiếng anh không",
+    "đồ chay ở đâu ngon", "spa làm đẹp", "taxi đi sân bay", "sửa xe máy gần đây",
+    "hải sản tươi", "ăn sáng gì ngon", "bảo hiểm xe máy", "cửa hàng tạp hóa",
+]
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """User + system CPU time of pid and its children, e.g. uvicorn workers (Linux only)"""
+    ticks = os.sysconf("SC_CLK_TCK")
+    total = 0.0
+    pids = [pid]
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    for child in pids:
+        try:
+            with open(f"/proc/{child}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+        except (OSError, IndexError, ValueError):
+            pass
+    return total
+
+
+def voice_note(seconds: float = 4.0) -> bytes:
+    """A small 16 kHz mono WAV standing in for a recorded question"""
+    rate = 16000
+    frames = bytearray()
+    for i in range(int(rate * seconds)):
+        sample = int(8000 * math.sin(2 * math.pi * 440 * i / rate))
+        frames += sample.to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+class Scenario:
+    """One endpoint under load: request() returns (ok, time to first byte)"""
+
+    def __init__(self, client: httpx.AsyncClient, unique: bool):
+        self.client = client
+        self.unique = unique
+        self.counter = 0
+        self.audio = voice_note()
+
+    def question(self) -> str:
+        self.counter += 1
+        question = random.choice(QUESTIONS)
+        # Unique questions defeat the answer and tool caches to measure the cold path
+        return f"{question} {self.counter}" if self.unique else question
+
+    async def chat(self):
+        response = await self.client.post("/api/chat", json={"message": self.question()})
+        return response.status_code == 200, None
+
+    async def chat_stream(self):
+        start = time.perf_counter()
+        first = None
+        async with self.client.stream("POST", "/api/chat/stream", json={"message": self.question()}) as response:
+            ok = response.status_code == 200
+            async for line in response.aiter_lines():
+                if first is None and line.startswith("data:"):
+                    first = time.perf_counter() - start
+                if line.startswith("event: error"):
+                    ok = False
+        return ok, first
+
+    async def transcribe(self):
+        response = await self.client.post("/api/transcribe", files={"file": ("voice.wav", self.audio, "audio/wav")})
+        return response.status_code == 200 and response.json().get("success"), None
+
+    async def voice(self):
+        start = time.perf_counter()
+        first = None
+        ok = False
+        files = {"file": ("voice.wav", self.audio, "audio/wav")}
+        async with self.client.stream("POST", "/api/voice", files=files) as response:
+            async for line in response.aiter_lines():
+                if first is None and line.startswith("data:"):
+                    first = time.perf_counter() - start
+                if line.startswith("event: done"):
+                    ok = True
+        return ok, first
+
+    async def history(self):
+        response = await self.client.get("/history", params={"limit": 50})
+        return response.status_code == 200, None
+
+
+async def load_endpoint(url: str, name: str, concurrency: int, duration: float, unique: bool, pid: int = None) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        scenario = Scenario(client, unique)
+        request = getattr(scenario, name)
+        latencies, first_bytes = [], []
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    ok, first = await request()
+                except httpx.HTTPError:
+                    ok, first = False, None
+                latencies.append(time.perf_counter() - start)
+                if first is not None:
+                    first_bytes.append(first)
+                errors += not ok
+
+        cpu_start = process_cpu_seconds(pid) if pid else None
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        cpu = process_cpu_seconds(pid) - cpu_start if pid else None
+
+    def summary(values: list) -> dict:
+        return {
+            "p50": round(percentile(values, 0.50) * 1000, 1),
+            "p95": round(percentile(values, 0.95) * 1000, 1),
+            "p99": round(percentile(values, 0.99) * 1000, 1),
+            "mean": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+            "max": round(max(values, default=0) * 1000, 1),
+        }
+
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": summary(latencies),
+        # Percent of one core used by the server process and its workers
+        "worker_cpu_percent": round(cpu / elapsed * 100, 1) if cpu is not None else None,
+    }
+    if first_bytes:
+        result["first_byte_ms"] = summary(first_bytes)
+    return result
+
+
+async def run(url: str, endpoints: list, concurrency: int, duration: float, unique: bool, pid: int = None,
+              config: dict = None) -> dict:
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {"url": url, "concurrency": concurrency, "duration": duration, "unique": unique, **(config or {})},
+        "endpoints": {},
+    }
+    for name in endpoints:
+        print(f"loading {name} ...", file=sys.stderr)
+        report["endpoints"][name] = await load_endpoint(url, name, concurrency, duration, unique, pid)
+    return report
+
+
+def add_load_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--endpoints", default="chat,chat_stream,transcribe,voice,history",
+                        help="comma separated: chat, chat_stream, transcribe, voice, history")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20, help="seconds per endpoint")
+    parser.add_argument("--unique", action="store_true", help="make every question unique to bypass caches")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+
+
+def write_report(report: dict, output: str = None) -> None:
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--pid", type=int, help="server process to measure CPU of")
+    add_load_arguments(parser)
+    args = parser.parse_args()
+    report = asyncio.run(run(args.url, args.endpoints.split(","), args.concurrency, args.duration, args.unique, args.pid))
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Run the API against the local fakes and load it, writing a JSON report.
+
+    pip install -e ".[bench]"
+    python -m bench.run --workers 2 --duration 30 --output bench-main.json -- --llm-latency 1.2
+
+Options after -- go to bench.fakes. With --redis-port 0 the REDIS_* variables
+of the environment are used instead of the built-in fakeredis.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+import httpx
+from . import fakes, load
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up in {timeout}s")
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    fake_argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    argv = argv[:argv.index("--")] if "--" in argv else argv
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    load.add_load_arguments(parser)
+    args = parser.parse_args(argv)
+    fake_args = fakes.parser().parse_args(fake_argv)
+
+    env = {
+        **os.environ,
+        "GITHUB_TOKEN": "bench",
+        "GROQ_API_KEY": "bench",
+        "GITHUB_MODELS_ENDPOINT": f"http://127.0.0.1:{fake_args.llm_port}",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{fake_args.llm_port}",
+        "API_BASE_URL": f"http://127.0.0.1:{fake_args.catalog_port}",
+        # The workers split the scheduler limits between them
+        "WEB_CONCURRENCY": str(args.workers),
+        # The fakes have no quota; set these to load the scheduler against real limits
+        "LLM_RPM": os.environ.get("LLM_RPM", "0"),
+        "LLM_CONCURRENCY": os.environ.get("LLM_CONCURRENCY", "0"),
+        "GROQ_CHAT_RPM": os.environ.get("GROQ_CHAT_RPM", "0"),
+        "GROQ_CHAT_TPM": os.environ.get("GROQ_CHAT_TPM", "0"),
+        "GROQ_CHAT_CONCURRENCY": os.environ.get("GROQ_CHAT_CONCURRENCY", "0"),
+        "TRANSCRIPTION_RPM": os.environ.get("TRANSCRIPTION_RPM", "0"),
+        "TRANSCRIPTION_CONCURRENCY": os.environ.get("TRANSCRIPTION_CONCURRENCY", "0"),
+    }
+    if fake_args.redis_port:
+        env.update({"REDIS_HOST": "127.0.0.1", "REDIS_PORT": str(fake_args.redis_port), "REDIS_PASSWORD": ""})
+
+    processes = []
+    try:
+        processes.append(subprocess.Popen([sys.executable, "-m", "bench.fakes", *fake_argv], cwd=ROOT))
+        wait_until_up(f"http://127.0.0.1:{fake_args.llm_port}/health")
+
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(args.port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+        )
+        processes.append(server)
+        url = f"http://127.0.0.1:{args.port}"
+        wait_until_up(f"{url}/stats")
+
+        config = {"workers": args.workers, "fakes": vars(fake_args)}
+        report = asyncio.run(load.run(url, args.endpoints.split(","), args.concurrency, args.duration,
+                                      args.unique, server.pid, config))
+        # Counters of the last worker that answered, for cache and queue behaviour
+        report["server_stats"] = httpx.get(f"{url}/stats", timeout=10).json()
+        load.write_report(report, args.output)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 from .groq import GroqService
 from .gpt import GPTAssistant
+from .usage import TokenUsage
+from .memory import ConversationMemory
+from .scheduler import Overloaded
 
 
-__all__ = ["GroqService", "GPTAssistant"]
+__all__ = ["GroqService", "GPTAssistant", "TokenUsage", "ConversationMemory", "Overloaded"]
@@ -0,0 +1,142 @@
+"""Cache of final answers to stateless questions.
+
+Besides exact repeats, a question matches an earlier one only when it asks the
+same words, ignoring order and sentence particles. There is no similarity
+threshold, and this index of earlier questions is kept per worker even when
+the answers themselves are shared through Redis.
+"""
+import os
+import re
+import json
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from store import Cache
+from .text import fold
+
+load_dotenv()
+
+# Tool results seen while the current answer is being produced
+_trace = ContextVar("answer_trace", default=None)
+
+
+class AnswerTrace:
+    def __init__(self):
+        # tool cache key -> digest of the result the answer was built from
+        self.tools = {}
+        self.failed = False
+
+
+# Sentence particles that do not change what is asked
+PARTICLES = {"ạ", "à", "nhé", "nha", "nhỉ", "ơi", "vậy", "thế", "hả", "hở", "ha", "đó"}
+
+
+def terms(question: str) -> frozenset:
+    """Words of a question with their diacritics, without particles"""
+    return frozenset(re.findall(r"\w+", unicodedata.normalize("NFC", question.lower()))) - PARTICLES
+
+
+class AnswerCache:
+    """Final answers to stateless questions, keyed on the folded question text.
+
+    A question with no exact entry falls back to a recent question with the
+    same words in another order or with other particles; a single different
+    word, say "block A" and "block B", is a different question. An entry is
+    dropped as soon as one of the tool results it was built from changes.
+    """
+
+    def __init__(self, redis=None):
+        self.ttl = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+        self.max_size = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+        self.cache = Cache(
+            "answers",
+            max_size=self.max_size,
+            redis=redis if os.getenv("ANSWER_CACHE_REDIS") == "1" else None,
+        )
+        # Recently answered questions for the fallback, terms -> folded text
+        self._questions = OrderedDict()
+        # Latest known result digest per tool cache key, least recently observed first; sized
+        # like the tool cache, whose evicted keys are loaded, and observed, again when next used
+        self._digests = OrderedDict()
+        self.max_digests = int(os.getenv("TOOL_CACHE_SIZE", "512"))
+        # How a question without an exact entry finds an earlier one, shown on /stats
+        self.similar_match = "same words, per worker"
+        self.stats = {"hits": 0, "similar_hits": 0, "misses": 0, "invalidated": 0, "stored": 0}
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.stats["hits"] + self.stats["similar_hits"]
+        total = hits + self.stats["misses"]
+        return round(hits / total, 4) if total else 0.0
+
+    def begin(self) -> tuple:
+        """Start recording the tool results of the answer being produced, returning (trace, token)"""
+        trace = AnswerTrace()
+        return trace, _trace.set(trace)
+
+    def end(self, token) -> None:
+        _trace.reset(token)
+
+    @staticmethod
+    def digest(result) -> str:
+        return hashlib.sha1(json.dumps(result, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+    def observe(self, key: str, result) -> None:
+        """Note a freshly loaded tool result as the latest data for key"""
+        self._digests[key] = self.digest(result)
+        self._digests.move_to_end(key)
+        while len(self._digests) > self.max_digests:
+            self._digests.popitem(last=False)
+
+    def record(self, key: str, result) -> None:
+        """Note the tool result the answer in progress is built from"""
+        trace = _trace.get()
+        if trace is not None:
+            trace.tools[key] = self.digest(result)
+
+    def fail(self) -> None:
+        """Keep the answer in progress out of the cache, one of its tool calls failed"""
+        trace = _trace.get()
+        if trace is not None:
+            trace.failed = True
+
+    async def get(self, question: str):
+        """Cached answer text for question, or None"""
+        folded = fold(question)
+        if not folded:
+            return None
+        entry = await self.cache.get(folded)
+        similar = False
+        if entry is None:
+            match = self.similar(question)
+            entry = await self.cache.get(match) if match else None
+            similar = entry is not None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        # Digests only known to other workers, or evicted here, are trusted until the entry expires
+        if any(self._digests.get(key, digest) != digest for key, digest in entry["tools"].items()):
+            self.stats["invalidated"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.stats["similar_hits" if similar else "hits"] += 1
+        return entry["content"]
+
+    def similar(self, question: str):
+        """Folded text of a recent question asking the same words, or None"""
+        return self._questions.get(terms(question))
+
+    async def set(self, question: str, content: str, trace: AnswerTrace) -> None:
+        folded = fold(question)
+        if not folded or not content or trace.failed:
+            return
+        await self.cache.set(folded, {"content": content, "tools": dict(trace.tools)}, self.ttl)
+        key = terms(question)
+        self._questions[key] = folded
+        self._questions.move_to_end(key)
+        while len(self._questions) > self.max_size:
+            self._questions.popitem(last=False)
+        self.stats["stored"] += 1
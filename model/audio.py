@@ -0,0 +1,121 @@
+import os
+import re
+import asyncio
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FFMPEG = os.getenv("FFMPEG_PATH", "ffmpeg")
+# Whisper resamples everything to 16 kHz mono, anything more is wasted upload
+SAMPLE_RATE = 16000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+
+# Output format per LONG_AUDIO_CODEC: (ffmpeg arguments, file name the API uses to detect the format)
+CODECS = {
+    "opus": (["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"], "segment.ogg"),
+    "flac": (["-c:a", "flac", "-f", "flac"], "segment.flac"),
+}
+
+
+class AudioError(Exception):
+    pass
+
+
+async def run_ffmpeg(args: list, data: bytes) -> tuple:
+    """Run ffmpeg with data on stdin, returning (stdout, stderr)"""
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG, "-hide_banner", "-nostats", *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate(data)
+    log = stderr.decode(errors="replace")
+    if process.returncode != 0:
+        lines = log.strip().splitlines()
+        raise AudioError(lines[-1] if lines else "ffmpeg failed")
+    return stdout, log
+
+
+def write_file(file, data: bytes) -> None:
+    file.write(data)
+    file.flush()
+
+
+async def decode(data: bytes, filename: str, silence_db: float, silence_seconds: float) -> tuple:
+    """Decode any container to 16 kHz mono PCM, returning (pcm, [(silence_start, silence_end), ...]) in seconds"""
+    # Containers like m4a keep their index at the end and cannot be decoded from
+    # a pipe, so the upload goes through a temp file in the system temp dir
+    suffix = os.path.splitext(filename or "")[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as source:
+        # Tens of megabytes of disk writes would stall every request on the event loop
+        await asyncio.to_thread(write_file, source, data)
+        pcm, log = await run_ffmpeg([
+            "-i", source.name,
+            "-af", f"silencedetect=noise={silence_db}dB:d={silence_seconds}",
+            "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1",
+        ], b"")
+
+    starts = [float(value) for value in re.findall(r"silence_start: (-?[\d.]+)", log)]
+    ends = [float(value) for value in re.findall(r"silence_end: (-?[\d.]+)", log)]
+    duration = len(pcm) / BYTES_PER_SECOND
+    # A trailing silence has a start but no end
+    silences = list(zip(starts, ends + [duration] * (len(starts) - len(ends))))
+    return pcm, silences
+
+
+def split_points(duration: float, silences: list, segment_seconds: float, search_seconds: float) -> list:
+    """Cut positions in seconds, each in the middle of the last silence before the segment limit when there is one"""
+    points = [0.0]
+    while duration - points[-1] > segment_seconds:
+        limit = points[-1] + segment_seconds
+        candidates = [
+            (start + end) / 2 for start, end in silences
+            if limit - search_seconds <= (start + end) / 2 <= limit
+        ]
+        points.append(max(candidates) if candidates else limit)
+    points.append(duration)
+    return points
+
+
+def segments(pcm: bytes, points: list, overlap_seconds: float) -> list:
+    """PCM slices between consecutive cut points, each widened by overlap_seconds on both sides"""
+    result = []
+    for start, end in zip(points, points[1:]):
+        first = max(0, int((start - overlap_seconds) * SAMPLE_RATE)) * 2
+        last = min(len(pcm), int((end + overlap_seconds) * SAMPLE_RATE) * 2)
+        result.append(pcm[first:last])
+    return result
+
+
+async def encode(pcm: bytes, codec: str) -> tuple:
+    """Encode 16 kHz mono PCM compactly, returning the (filename, bytes) pair the API client uploads"""
+    args, filename = CODECS[codec]
+    data, _ = await run_ffmpeg(["-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "pipe:0", *args, "pipe:1"], pcm)
+    return filename, data
+
+
+def words(text: str) -> list:
+    return re.findall(r"\w+", text.lower())
+
+
+def stitch(transcripts: list, max_overlap_words: int = 12) -> str:
+    """Join segment transcripts, dropping the words repeated where overlapping segments meet"""
+    text = ""
+    for transcript in transcripts:
+        transcript = transcript.strip()
+        if not text:
+            text = transcript
+            continue
+        tail, head = words(text)[-max_overlap_words:], words(transcript)
+        repeated = next(
+            (size for size in range(min(len(tail), len(head)), 0, -1) if tail[-size:] == head[:size]),
+            0,
+        )
+        if repeated:
+            # Skip the first `repeated` words of the new segment, keeping its punctuation after them
+            match = list(re.finditer(r"\w+", transcript))[repeated - 1]
+            transcript = transcript[match.end():].lstrip(" ,.;:")
+        text = f"{text} {transcript}".strip()
+    return text
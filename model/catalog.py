@@ -0,0 +1,102 @@
+# Mapping tables shared by the system prompt and the intent router
+
+CATEGORY_MAP = [
+    ("Thức phẩm", "food"),
+    ("Đồ uống", "drinks"),
+    ("Giặt ủi", "laundry"),
+    ("Dạy học", "tutoring"),
+    ("Điện tử-Vi Tính", "electronicsrepair"),
+    ("Sửa Nhà-Đồ Gia Dụng", "repairehouse"),
+    ("Món nhậu bình dân", "foodforbeer"),
+    ("Ôtô-Xe Máy", "motor"),
+    ("Sửa Quần Áo", "repaircloth"),
+    ("Máy tính", "computer"),
+    ("Làm đẹp", "beautiful"),
+    ("Chăm sóc sức khỏe", "healthycare"),
+    ("Cửa hàng-Shop", "glocerystore"),
+    ("Điện Lạnh", "refrigeration"),
+    ("Vận Tải-Taxi", "transporter_taxi"),
+    ("Thể Thao", "sport"),
+    ("Dịch vụ khác", "otherservices"),
+    ("Làm nội thất", "funiture"),
+    ("Bảo Hiểm", "insuarance"),
+]
+
+SERVICE_MAP = [
+    ("Thức ăn nhanh", "fastfood"),
+    ("Ăn vặt", "anvat"),
+    ("Món chính", "monchinh"),
+    ("Đồ nướng và lẩu", "donuongvalau"),
+    ("Đồ chay", "dochay"),
+    ("Hải sản", "haisan"),
+    ("Trà sữa", "trasua"),
+    ("Cà phê", "coffee"),
+    ("Nước ép & Sinh tố", "nuocep"),
+    ("Đồ uống có cồn", "cocktail"),
+    ("Giặt thường", "regularwashing"),
+    ("Giặt khô", "drywashing"),
+    ("Giặt sấy tự động", "automaticwash"),
+    ("Học Võ", "hocvo"),
+    ("Cầu Lông", "caulong"),
+    ("Dạy Tiếng Anh", "daytienganh"),
+    ("Spa", "Spa"),
+    ("Dạy Toán Lý Hóa", "daytoanlyhoa"),
+    ("Vận Tải", "vantai"),
+    ("Taxi", "taxi"),
+    ("Dạy đàn", "dayan"),
+    ("Món nhậu Bình Dân", "monnhaubinhdan"),
+    ("Điện tử", "dientu"),
+    ("Vi tính", "vitinh"),
+    ("Máy Lạnh", "maylanh"),
+    ("Xe Máy", "xemay"),
+    ("Xe Oto", "xeoto"),
+    ("Tủ lạnh", "tulanh"),
+    ("Sửa nhà", "suanha"),
+    ("Sửa đồ Gia Dụng", "suaogiadung"),
+    ("Tạp Hóa", "taphoa"),
+    ("Shop nhỏ tại Nhà", "shopnhotainha"),
+    ("Sửa chữa Điện Thoại", "suachuaienthoai"),
+    ("Làm nội thất", "lamnoithat"),
+    ("Thay Phụ Kiện", "thayphukien"),
+    ("Làm Tóc-Nail-Trang điểm", "lamtoc_nail"),
+    ("Massage Body", "massagebody"),
+    ("Viễn Thông", "vienthong"),
+    ("Giặt-Vệ Sinh-Đệm-Ghế", "giat-vesinh-em-ghe"),
+    ("Vệ sinh Nhà", "vesinhnha"),
+    ("Món Phụ", "monphu"),
+    ("Môi giới Căn Hộ", "moigioicanho"),
+    ("Ăn sáng", "ansang"),
+    ("Bảo Hiểm Xe Máy", "baohiemxemay"),
+    ("Bảo Hiểm Xe Ô tô", "baohiemxeoto"),
+    ("Bảo Hiểm Nhân Thọ", "baohiemnhantho"),
+    ("Bảo Hiểm Cháy Nổ", "baohiemchayno"),
+    ("Câu lạc bộ", "caulacbo"),
+    ("Hớt Tóc Nam", "hottocnam"),
+    ("Dạy lái xe", "daylaixe"),
+]
+
+BEAUTY_KEYWORDS = [
+    "làm đẹp", "beauty", "spa", "thẩm mỹ", "chăm sóc da", "massage", "nail", "tóc", "makeup", "trang điểm",
+]
+
+# The system prompt asks for get_service with this category for any beauty keyword
+BEAUTY_CATEGORY = "beauty"
+
+# Generic questions that map to a tool without naming a category or service
+INTENT_KEYWORDS = {
+    "get_categories": [
+        "danh mục", "dịch vụ chính", "có những dịch vụ nào", "có dịch vụ gì", "các dịch vụ hiện có",
+    ],
+    "get_top_food": [
+        "món ăn nổi bật", "món ngon", "top món ăn", "món ăn ngon",
+    ],
+}
+
+# Questions that the prompt answers without any tool
+NO_TOOL_KEYWORDS = [
+    "quảng cáo", "quảng bá", "đăng ký", "dịch vụ khác", "giới thiệu thêm",
+]
+
+
+def mapping_table(pairs: list) -> str:
+    return "\n".join(f"- {name} -> {code}" for name, code in pairs)
@@ -0,0 +1,130 @@
+import os
+import time
+import random
+import asyncio
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class CircuitOpenError(Exception):
+    """Raised when the catalog backend is failing and calls are rejected without a request"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go through; lets one trial call through per reset_timeout while open"""
+        if self.state == "closed":
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class CatalogClient:
+    """Shared keep-alive HTTP client for the catalog backend with timeouts, retries and a circuit breaker"""
+
+    def __init__(self, base_url: str):
+        self.max_connections = int(os.getenv("CATALOG_MAX_CONNECTIONS", "50"))
+        self.retries = int(os.getenv("CATALOG_RETRIES", "2"))
+        self.backoff = float(os.getenv("CATALOG_BACKOFF", "0.2"))
+        self.read_timeout = float(os.getenv("CATALOG_READ_TIMEOUT", "8"))
+        self.connect_timeout = float(os.getenv("CATALOG_CONNECT_TIMEOUT", "3"))
+        # All attempts of one call, backoff included, end before the tool call that waits for them gives up
+        self.deadline = float(os.getenv("CATALOG_DEADLINE", str(0.8 * float(os.getenv("TOOL_TIMEOUT", "10")))))
+        self.http = httpx.AsyncClient(
+            base_url=base_url or "",
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=int(os.getenv("CATALOG_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(os.getenv("CATALOG_KEEPALIVE_EXPIRY", "60")),
+            ),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("CATALOG_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("CATALOG_BREAKER_RESET", "30")),
+        )
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.counters = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+    @property
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "max_connections": self.max_connections,
+            "breaker_state": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+        }
+
+    async def get_json(self, path: str, params: dict = None):
+        """GET a catalog endpoint and decode its JSON body"""
+        if not self.breaker.allow():
+            self.counters["rejected"] += 1
+            raise CircuitOpenError(f"catalog backend unavailable, retry in {self.breaker.reset_timeout}s")
+
+        started = time.monotonic()
+        for attempt in range(self.retries + 1):
+            remaining = self.deadline - (time.monotonic() - started)
+            try:
+                response = await self._get(path, params, httpx.Timeout(
+                    min(self.read_timeout, remaining), connect=min(self.connect_timeout, remaining),
+                ))
+                # Only 429 and 5xx are worth retrying, other errors mean the request itself is wrong
+                if response.status_code != 429 and response.status_code < 500:
+                    self.breaker.record_success()
+                    response.raise_for_status()
+                    return response.json()
+                error = httpx.HTTPStatusError(
+                    f"catalog returned {response.status_code}", request=response.request, response=response
+                )
+            except httpx.TransportError as e:
+                error = e
+
+            # Full jitter keeps retries from many workers from arriving in lockstep
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            if attempt >= self.retries or time.monotonic() - started + delay >= self.deadline:
+                break
+            self.counters["retries"] += 1
+            await asyncio.sleep(delay)
+
+        self.counters["failures"] += 1
+        self.breaker.record_failure()
+        raise error
+
+    async def _get(self, path: str, params: dict = None, timeout: httpx.Timeout = None) -> httpx.Response:
+        self.counters["requests"] += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self.http.get(path, params=params, timeout=timeout or self.http.timeout)
+        finally:
+            self.in_flight -= 1
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
@@ -0,0 +1,87 @@
+import os
+import json
+import math
+from dotenv import load_dotenv
+from store.telemetry import log
+
+load_dotenv()
+
+# Fields of each tool result item that the answer templates actually use
+TOOL_FIELDS = {
+    "get_categories": ["name", "id"],
+    "get_top_food": ["name", "priceRangeLow", "priceRangeHigh", "address", "phoneNumber"],
+    "get_service": ["name", "id", "deliveryAvailable"],
+    "get_top_restaurants": [
+        "name", "serviceName", "address", "phoneNumber", "priceRangeLow", "priceRangeHigh",
+        "openingHourStart", "openingHourEnd", "deliveryAvailable", "averageRating",
+    ],
+    "get_service_advertisements": [
+        "name", "serviceName", "description", "address", "phoneNumber",
+        "openingHourStart", "openingHourEnd", "averageRating",
+    ],
+    "get_popular_advertisements": [
+        "name", "serviceName", "description", "address", "phoneNumber", "priceRangeLow", "priceRangeHigh",
+        "openingHourStart", "openingHourEnd", "deliveryAvailable", "averageRating",
+    ],
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about 3 characters per token for Vietnamese and JSON punctuation"""
+    return math.ceil(len(text) / 3)
+
+
+class ResultCompactor:
+    """Shrink tool results before they go back to the model: project fields, truncate descriptions, cap list length"""
+
+    def __init__(self):
+        self.token_budget = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "1200"))
+        self.description_chars = int(os.getenv("TOOL_RESULT_DESCRIPTION_CHARS", "200"))
+        self.stats = {"calls": 0, "bytes_in": 0, "bytes_out": 0, "tokens_saved": 0, "items_dropped": 0}
+
+    def compact(self, name: str, content: str) -> str:
+        try:
+            result = json.loads(content)
+        except ValueError:
+            return content
+        if not isinstance(result, dict):
+            return content
+
+        fields = TOOL_FIELDS.get(name)
+        dropped = 0
+        for key, items in result.items():
+            if not isinstance(items, list):
+                continue
+            items = [self.compact_item(item, fields) for item in items]
+            # Length of json.dumps({key: items}): the wrapper, each item once and a ", " between items
+            sizes = [len(json.dumps(item, ensure_ascii=False)) for item in items]
+            length = len(json.dumps({key: []}, ensure_ascii=False)) + sum(sizes) + 2 * max(0, len(items) - 1)
+            # Results come ranked, so the tail is what goes when over budget
+            while len(items) > 1 and math.ceil(length / 3) > self.token_budget:
+                items.pop()
+                length -= sizes.pop() + 2
+                dropped += 1
+            result[key] = items
+        if dropped:
+            result["omitted"] = dropped
+
+        compacted = json.dumps(result, ensure_ascii=False)
+        bytes_in, bytes_out = len(content.encode()), len(compacted.encode())
+        tokens_saved = estimate_tokens(content) - estimate_tokens(compacted)
+        self.stats["calls"] += 1
+        self.stats["bytes_in"] += bytes_in
+        self.stats["bytes_out"] += bytes_out
+        self.stats["tokens_saved"] += tokens_saved
+        self.stats["items_dropped"] += dropped
+        log("tool_result_compacted", tool=name, bytes_in=bytes_in, bytes_out=bytes_out, tokens_saved=tokens_saved, dropped=dropped)
+        return compacted
+
+    def compact_item(self, item, fields):
+        if not isinstance(item, dict):
+            return item
+        if fields:
+            item = {field: item[field] for field in fields if field in item}
+        description = item.get("description")
+        if isinstance(description, str) and len(description) > self.description_chars:
+            item["description"] = description[:self.description_chars].rstrip() + "…"
+        return item
@@ -1,21 +1,72 @@
 import os
-from openai import OpenAI
+import time
+import asyncio
 from dotenv import load_dotenv
 import json
-import requests
+import uuid
+import inspect
+from store import Cache
+from store.telemetry import span, log, observe_payload, count_tokens
+from .client import CatalogClient
+from .index import CatalogIndex
+from .catalog import CATEGORY_MAP, SERVICE_MAP, BEAUTY_KEYWORDS, BEAUTY_CATEGORY, mapping_table
+from .greeting import GREETING_REPLY, is_greeting, greeting_completion, local_completion
+from .router import IntentRouter
+from .usage import TokenUsage
+from .compaction import ResultCompactor
+from .singleflight import SingleFlight
+from .answers import AnswerCache
+from .prefetch import ToolPrefetcher
+from .text import fold
+from .scheduler import FINAL_TURN, FIRST_TURN, BACKGROUND
+from .providers import ProviderPool
 
 load_dotenv()
 
 class GPTAssistant:
-    def __init__(self):
-        self.token = os.getenv("GITHUB_TOKEN")
-        self.endpoint = "https://models.inference.ai.azure.com"
-        self.model_name = "gpt-4o-mini"
+    # Seconds a tool result stays fresh, the catalog changes only a few times a day
+    tool_cache_ttl = {
+        "get_categories": 3600,
+        "get_top_food": 900,
+        "get_service": 3600,
+        "get_top_restaurants": 900,
+        "get_service_advertisements": 900,
+        "get_popular_advertisements": 900,
+    }
+
+    def __init__(self, redis=None):
+        # GitHub Models first, Groq as hedge and failover target (LLM_PROVIDERS)
+        self.providers = ProviderPool.from_env()
+        self.model_name = self.providers.primary.model
         self.api_base_url = os.getenv("API_BASE_URL")
-        self.client = OpenAI(
-            base_url=self.endpoint,
-            api_key=self.token,
-        )
+        # Answer tokens reserved per completion until its real usage is known
+        self.output_tokens = int(os.getenv("LLM_OUTPUT_TOKENS", "400"))
+        self.catalog = CatalogClient(self.api_base_url)
+        # Local copy of the catalog, synced in the background, answers the tools without a request
+        self.index = CatalogIndex(self.catalog) if os.getenv("CATALOG_INDEX_ENABLED", "1") == "1" else None
+        self.tool_timeout = float(os.getenv("TOOL_TIMEOUT", "10"))
+        self.tool_cache_stale = float(os.getenv("TOOL_CACHE_STALE", "3600"))
+        self.router = IntentRouter() if os.getenv("INTENT_ROUTER", "1") == "1" else None
+        # Likely tool calls of a message the router cannot resolve start alongside the first completion
+        self.prefetcher = ToolPrefetcher(self.router) if os.getenv("TOOL_PREFETCH", "1") == "1" else None
+        # "compact" moves the mapping tables out of the prompt into tool parameter enums
+        self.prompt_mode = os.getenv("PROMPT_MODE", "full")
+        self.stream_usage = os.getenv("STREAM_USAGE", "1") == "1"
+        self.usage = TokenUsage()
+        self.compactor = ResultCompactor() if os.getenv("TOOL_RESULT_COMPACTION", "1") == "1" else None
+        self.cache = None
+        if os.getenv("TOOL_CACHE_ENABLED", "1") == "1":
+            self.cache = Cache(
+                "tools",
+                max_size=int(os.getenv("TOOL_CACHE_SIZE", "512")),
+                redis=redis if os.getenv("TOOL_CACHE_REDIS") == "1" else None,
+            )
+        # Concurrent identical tool calls share one backend request
+        self.tool_flights = SingleFlight()
+        # Opt-in: identical stateless questions arriving within the window share one answer
+        chat_window = float(os.getenv("CHAT_COALESCE_WINDOW", "0"))
+        self.chat_flights = SingleFlight(window=chat_window) if chat_window > 0 else None
+        self.answers = AnswerCache(redis) if os.getenv("ANSWER_CACHE_ENABLED", "1") == "1" else None
         self.tools = [
             {
                 "type": "function",
@@ -115,7 +166,19 @@ class GPTAssistant:
                 }
             }
         ]
-        self.system_message = """
+        if self.prompt_mode == "compact":
+            self.add_parameter_enums()
+            category_section = "Mã danh mục: luôn dùng đúng một giá trị trong enum của tham số công cụ.\n\n"
+            if self.router:
+                service_section = "Mã dịch vụ: nếu không chắc mã, truyền đúng tên dịch vụ khách hàng nhắc tới.\n\n"
+            else:
+                service_section = "Mã dịch vụ: luôn dùng đúng một giá trị trong enum của tham số công cụ.\n\n"
+        else:
+            category_section = f"Bảng ánh xạ danh mục:\n{mapping_table(CATEGORY_MAP)}\n\n"
+            service_section = f"Bảng ánh xạ dịch vụ:\n{mapping_table(SERVICE_MAP)}\n\n"
+        # Everything sent ahead of the user turn (tools, then this prompt) is static,
+        # so provider-side prompt caching can reuse the prefix across requests
+        self.system_message = f"""
 Bạn là chatbot AI của dichvuhungngan. Hãy trả lời với phong cách thân thiện, nhiệt tình và chuyên nghiệp. Luôn xưng "em" và gọi người dùng là "anh/chị":
 
 1. Với danh sách món ăn/nhà hàng:
@@ -211,32 +274,11 @@ Bạn là chatbot AI của dichvuhungngan. Hãy trả lời với phong cách th
 
    Anh/chị quan tâm đến dịch vụ nào, em có thể tư vấn chi tiết hơn ạ.
 
-Bảng ánh xạ danh mục:
-- Thức phẩm -> food
-- Đồ uống -> drinks
-- Giặt ủi -> laundry
-- Dạy học -> tutoring
-- Điện tử-Vi Tính -> electronicsrepair
-- Sửa Nhà-Đồ Gia Dụng -> repairehouse
-- Món nhậu bình dân -> foodforbeer
-- Ôtô-Xe Máy -> motor
-- Sửa Quần Áo -> repaircloth
-- Máy tính -> computer
-- Làm đẹp -> beautiful
-- Chăm sóc sức khỏe -> healthycare
-- Cửa hàng-Shop -> glocerystore
-- Điện Lạnh -> refrigeration
-- Vận Tải-Taxi -> transporter_taxi
-- Thể Thao -> sport
-- Dịch vụ khác -> otherservices
-- Làm nội thất -> funiture
-- Bảo Hiểm -> insuarance
-
-Các từ khóa về làm đẹp:
-- làm đẹp, beauty, spa, thẩm mỹ, chăm sóc da, massage, nail, tóc, makeup, trang điểm
+{category_section}Các từ khóa về làm đẹp:
+- {', '.join(BEAUTY_KEYWORDS)}
 
 Khi người dùng hỏi về dịch vụ làm đẹp hoặc các từ khóa liên quan:
-1. Sử dụng get_service với category_name="beauty"
+1. Sử dụng get_service với category_name="{BEAUTY_CATEGORY}"
 2. Hiển thị danh sách theo format:
    Dạ, trong lĩnh vực Làm đẹp, chúng em có các dịch vụ sau ạ:
 
@@ -252,59 +294,7 @@ Lưu ý:
 - Giọng điệu nhiệt tình, thân thiện và chuyên nghiệp
 - Luôn sẵn sàng hỗ trợ thêm
 
-Bảng ánh xạ dịch vụ:
-- Thức ăn nhanh -> fastfood
-- Ăn vặt -> anvat
-- Món chính -> monchinh
-- Đồ nướng và lẩu -> donuongvalau
-- Đồ chay -> dochay
-- Hải sản -> haisan
-- Trà sữa -> trasua
-- Cà phê -> coffee
-- Nước ép & Sinh tố -> nuocep
-- Đồ uống có cồn -> cocktail
-- Giặt thường -> regularwashing
-- Giặt khô -> drywashing
-- Giặt sấy tự động -> automaticwash
-- Học Võ -> hocvo
-- Cầu Lông -> caulong
-- Dạy Tiếng Anh -> daytienganh
-- Spa -> Spa
-- Dạy Toán Lý Hóa -> daytoanlyhoa
-- Vận Tải -> vantai
-- Taxi -> taxi
-- Dạy đàn -> dayan
-- Món nhậu Bình Dân -> monnhaubinhdan
-- Điện tử -> dientu
-- Vi tính -> vitinh
-- Máy Lạnh -> maylanh
-- Xe Máy -> xemay
-- Xe Oto -> xeoto
-- Tủ lạnh -> tulanh
-- Sửa nhà -> suanha
-- Sửa đồ Gia Dụng -> suaogiadung
-- Tạp Hóa -> taphoa
-- Shop nhỏ tại Nhà -> shopnhotainha
-- Sửa chữa Điện Thoại -> suachuaienthoai
-- Làm nội thất -> lamnoithat
-- Thay Phụ Kiện -> thayphukien
-- Làm Tóc-Nail-Trang điểm -> lamtoc_nail
-- Massage Body -> massagebody
-- Viễn Thông -> vienthong
-- Giặt-Vệ Sinh-Đệm-Ghế -> giat-vesinh-em-ghe
-- Vệ sinh Nhà -> vesinhnha
-- Món Phụ -> monphu
-- Môi giới Căn Hộ -> moigioicanho
-- Ăn sáng -> ansang
-- Bảo Hiểm Xe Máy -> baohiemxemay
-- Bảo Hiểm Xe Ô tô -> baohiemxeoto
-- Bảo Hiểm Nhân Thọ -> baohiemnhantho
-- Bảo Hiểm Cháy Nổ -> baohiemchayno
-- Câu lạc bộ -> caulacbo
-- Hớt Tóc Nam -> hottocnam
-- Dạy lái xe -> daylaixe
-
-8. Khi khách hàng hỏi về đăng ký quảng cáo/quảng bá dịch vụ:
+{service_section}8. Khi khách hàng hỏi về đăng ký quảng cáo/quảng bá dịch vụ:
    "Dạ, để đăng ký quảng cáo dịch vụ của anh/chị trên dichvuhungngan, anh/chị có thể:
 
    1. Nhấn vào nút 'Đăng ký quảng cáo' ở đầu trang web
@@ -314,11 +304,32 @@ Bảng ánh xạ dịch vụ:
 
    Em rất vui được hỗ trợ anh/chị quảng bá dịch vụ đến cư dân chung cư Hưng Ngân ạ."
 """
-
-    def get_categories(self):
+        self.tools_chars = len(json.dumps(self.tools, ensure_ascii=False))
+
+    def add_parameter_enums(self) -> None:
+        """Constrain the category code parameters to the codes of the mapping table"""
+        category_codes = [code for _, code in CATEGORY_MAP]
+        enums = {
+            ("get_service", "category_name"): category_codes + [BEAUTY_CATEGORY],
+            ("get_popular_advertisements", "category_name"): category_codes,
+        }
+        # The service codes would cost more prompt than they save; the router resolves service names instead
+        if not self.router:
+            enums[("get_service_advertisements", "service_name")] = [code for _, code in SERVICE_MAP]
+        for tool in self.tools:
+            function = tool["function"]
+            for (name, parameter), values in enums.items():
+                if function["name"] == name:
+                    function["parameters"]["properties"][parameter]["enum"] = values
+
+    async def get_json(self, path: str, params: dict = None):
+        """Catalog data from the local index when it has it, from the live API otherwise"""
+        data = self.index.lookup(path, params) if self.index else None
+        return data if data is not None else await self.catalog.get_json(path, params)
+
+    async def get_categories(self):
         """Get list of product categories from store"""
-        response = requests.get(f"{self.api_base_url}/api/v1/categories")
-        data = response.json()
+        data = await self.get_json("/api/v1/categories")
         categories = []
         for category in data["result"]:
             # Skip the "Tất cả" category
@@ -330,10 +341,9 @@ Bảng ánh xạ dịch vụ:
                 })
         return json.dumps({"categories": categories}, ensure_ascii=False)
 
-    def get_top_food(self):
+    async def get_top_food(self):
       """Get top 5 food from store"""
-      response = requests.get(f"{self.api_base_url}/api/v1/main-advertisements/top-food")
-      data = response.json()
+      data = await self.get_json("/api/v1/main-advertisements/top-food")
       products = []
       for product in data["result"]:
         products.append({
@@ -347,10 +357,9 @@ Bảng ánh xạ dịch vụ:
         })
       return json.dumps({"products": products}, ensure_ascii=False)
 
-    def get_service(self, category_name: str = ""):
+    async def get_service(self, category_name: str = ""):
         """Get service by name"""
-        response = requests.get(f"{self.api_base_url}/api/v1/advertisement-services/category?categoryName={category_name}")
-        data = response.json()
+        data = await self.get_json("/api/v1/advertisement-services/category", {"categoryName": category_name})
         services = []
         for service in data["result"]:
             services.append({
@@ -360,10 +369,9 @@ Bảng ánh xạ dịch vụ:
             })
         return json.dumps({"services": services}, ensure_ascii=False)
 
-    def get_top_restaurants(self, service_id: int = 0, limit: int = 10):
+    async def get_top_restaurants(self, service_id: int = 0, limit: int = 10):
         """Get top restaurants by service ID"""
-        response = requests.get(f"{self.api_base_url}/api/v1/main-advertisements/top-restaurants?serviceId={service_id}&limit={limit}")
-        data = response.json()
+        data = await self.get_json("/api/v1/main-advertisements/top-restaurants", {"serviceId": service_id, "limit": limit})
         restaurants = []
         for restaurant in data["result"]:
             restaurants.append({
@@ -384,10 +392,9 @@ Bảng ánh xạ dịch vụ:
             })
         return json.dumps({"restaurants": restaurants}, ensure_ascii=False)
 
-    def get_service_advertisements(self, service_name: str):
+    async def get_service_advertisements(self, service_name: str):
         """Get advertisements by service name"""
-        response = requests.get(f"{self.api_base_url}/api/v2/main-advertisements/service2?serviceName={service_name}")
-        data = response.json()
+        data = await self.get_json("/api/v2/main-advertisements/service2", {"serviceName": service_name})
         ads = []
         
         if data.get("result") and data["result"].get("responseList"):
@@ -411,10 +418,9 @@ Bảng ánh xạ dịch vụ:
         
         return json.dumps(result, ensure_ascii=False)
 
-    def get_popular_advertisements(self, category_name: str):
+    async def get_popular_advertisements(self, category_name: str):
         """Get popular advertisements by category name"""
-        response = requests.get(f"{self.api_base_url}/api/v2/main-advertisements/top-populars?categoryName={category_name}")
-        data = response.json()
+        data = await self.get_json("/api/v2/main-advertisements/top-populars", {"categoryName": category_name})
         ads = []
         
         if data.get("result"):
@@ -443,67 +449,342 @@ Bảng ánh xạ dịch vụ:
         
         return json.dumps(result, ensure_ascii=False)
 
-    def process_message(self, user_message: str):
-        print(user_message)
-
-        # Check if message is a greeting
-        greetings = [
-            "xin chào", "hi", "hello", "chào",
-            "bạn có thể giúp cho tôi", "bạn có thể giúp tôi",
-            "cho tôi hỏi", "tôi cần hỏi", "tôi muốn hỏi",
-            "chào bạn", "hey", "có ai không",
-            "bạn ơi", "alo", "giúp tôi", "giúp mình",
-            "mình cần hỏi", "mình muốn hỏi",
-            "chào shop", "shop ơi", "cửa hàng ơi",
-            "có thể giúp mình", "có thể tư vấn"
-        ]
-        if any(greeting in user_message.lower() for greeting in greetings):
-            return self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": "Bạn là chatbot AI của dichvuhungngan. Hãy trả lời với phong cách thân thiện, nhiệt tình và chuyên nghiệp. Luôn xưng 'em' và gọi người dùng là 'anh/chị':\n\nVới lời chào:\n'Xin chào anh/chị! Em là trợ lý ảo của dichvuhungngan. Em rất vui được hỗ trợ anh/chị tìm hiểu về các dịch vụ của chúng em ạ.'"},
-                    {"role": "user", "content": user_message},
-                    {"role": "assistant", "content": "Xin chào anh/chị! Em là trợ lý ảo của dichvuhungngan. Em rất vui được hỗ trợ anh/chị tìm hiểu về các dịch vụ của chúng em ạ."}
-                ],
-                model=self.model_name,
+    def tool_key(self, name: str, arguments: dict) -> tuple:
+        """(normalized arguments, tool cache key) of a tool call"""
+        arguments = self.normalize_arguments(getattr(self, name), arguments)
+        if self.router:
+            arguments = self.router.resolve_codes(arguments)
+        return arguments, f"{name}:{json.dumps(arguments, sort_keys=True, ensure_ascii=False)}"
+
+    async def call_tool(self, name: str, arguments: dict):
+        """Call a tool method by name, serving repeated calls from the tool cache and sharing concurrent identical ones"""
+        callable_func = getattr(self, name)
+        arguments, key = self.tool_key(name, arguments)
+
+        async def load():
+            result = await self.tool_flights.do(key, lambda: callable_func(**arguments))
+            # Background refreshes pass through here too, so changed data invalidates cached answers
+            if self.answers:
+                self.answers.observe(key, result)
+            return result
+
+        if self.cache is None:
+            result = await load()
+        else:
+            ttl = float(os.getenv(f"TOOL_CACHE_TTL_{name.upper()}", self.tool_cache_ttl.get(name, 900)))
+            result = await self.cache.get_or_load(
+                key,
+                load,
+                ttl=ttl,
+                stale_ttl=self.tool_cache_stale,
             )
+        # The result actually used, possibly a stale one being refreshed, is what the answer depends on
+        if self.answers:
+            self.answers.record(key, result)
+        return result
+
+    @staticmethod
+    def normalize_arguments(func, arguments: dict) -> dict:
+        """Fill in defaults and strip string values so equivalent calls share a cache key"""
+        bound = inspect.signature(func).bind(**arguments)
+        bound.apply_defaults()
+        return {
+            name: value.strip() if isinstance(value, str) else value
+            for name, value in bound.arguments.items()
+        }
 
-        # Original system message and logic for non-greeting messages
+    @staticmethod
+    def parse_arguments(arguments: str) -> dict:
+        return json.loads(arguments.replace("'", '"') or "{}")
+
+    async def run_tool_call(self, name: str, arguments: str, speculation=None):
+        """Run one tool call from the model with a timeout, returning the tool message content"""
+        with span("tool", name, arguments=arguments) as tool:
+            try:
+                function_args = self.parse_arguments(arguments)
+                prefetched = speculation.take(self.tool_key(name, function_args)[1]) if speculation else None
+                tool.set(prefetched=prefetched is not None)
+                # Shielded, the same prefetch may serve several identical calls of one turn
+                call = asyncio.shield(prefetched) if prefetched else self.call_tool(name, function_args)
+                function_return = await asyncio.wait_for(call, self.tool_timeout)
+            except asyncio.TimeoutError:
+                log("tool_timeout", "warning", tool=name, timeout=self.tool_timeout)
+                if self.answers:
+                    self.answers.fail()
+                tool.set(error="timeout")
+                return json.dumps({"error": f"{name} timed out"}, ensure_ascii=False)
+            except Exception as e:
+                log("tool_failed", "warning", tool=name, error=str(e))
+                if self.answers:
+                    self.answers.fail()
+                tool.set(error=type(e).__name__)
+                return json.dumps({"error": f"{name} failed"}, ensure_ascii=False)
+            size = len(function_return.encode())
+            tool.set(bytes=size)
+        observe_payload("tool", name, size)
+        return function_return
+
+    async def append_tool_results(self, messages: list, tool_calls: list, speculation=None) -> None:
+        """Run tool calls (as dicts) concurrently and append their results to messages in the original order"""
+        results = await asyncio.gather(*(
+            self.run_tool_call(tool_call["function"]["name"], tool_call["function"]["arguments"], speculation)
+            for tool_call in tool_calls
+        ))
+
+        for tool_call, function_return in zip(tool_calls, results):
+            if self.compactor:
+                function_return = self.compactor.compact(tool_call["function"]["name"], function_return)
+            messages.append(
+                {
+                    "tool_call_id": tool_call["id"],
+                    "role": "tool",
+                    "name": tool_call["function"]["name"],
+                    "content": function_return,
+                }
+            )
+
+    def route(self, user_message: str):
+        """Tool calls (as dicts) for a message the intent router resolves confidently, otherwise None"""
+        routed = self.router.route(user_message) if self.router else None
+        if not routed:
+            return None
+        name, arguments = routed
+        log("routed", tool=name, arguments=arguments)
+        return [{
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)},
+        }]
+
+    async def build_messages(self, user_message: str, history: list = None) -> list:
+        """Conversation for a non-greeting message, with the tool results already in when the router resolves it"""
         messages = [
             {"role": "system", "content": self.system_message},
+            *(history or []),
             {"role": "user", "content": user_message}
         ]
 
-        response = self.client.chat.completions.create(
-            messages=messages,
-            tools=self.tools,
-            model=self.model_name,
-        )
-
-        if response.choices[0].finish_reason == "tool_calls":
-            messages.append(response.choices[0].message)
-
-            for tool_call in response.choices[0].message.tool_calls:
-                if tool_call.type == "function":
-                    function_args = json.loads(tool_call.function.arguments.replace("'", '"'))
-                    print(f"Calling function `{tool_call.function.name}` with arguments {function_args}")
-                    callable_func = getattr(self, tool_call.function.name)
-                    function_return = callable_func(**function_args)
-                    print(f"Function returned = {function_return}")
-
-                    messages.append(
-                        {
-                            "tool_call_id": tool_call.id,
-                            "role": "tool",
-                            "name": tool_call.function.name,
-                            "content": function_return,
-                        }
-                    )
-
-            response = self.client.chat.completions.create(
+        # A routed message skips the tool-selection completion, the next
+        # completion then only has to format the tool results
+        routed = self.route(user_message)
+        if routed:
+            messages.append({"role": "assistant", "content": None, "tool_calls": routed})
+            await self.append_tool_results(messages, routed)
+
+        return messages
+
+    def speculate(self, user_message: str, messages: list):
+        """Start the predicted tool calls of a message whose tools the router did not run already"""
+        if self.prefetcher is None or messages[-1]["role"] == "tool":
+            return None
+        return self.prefetcher.start(user_message, lambda name, arguments: self.tool_key(name, arguments)[1], self.call_tool)
+
+    def finish_speculation(self, speculation, tool_calls: list) -> None:
+        """Score and learn from the tool calls (as dicts) the model actually made"""
+        if speculation is None:
+            return
+        made = {}
+        for tool_call in tool_calls:
+            name = tool_call["function"]["name"]
+            try:
+                arguments, key = self.tool_key(name, self.parse_arguments(tool_call["function"]["arguments"]))
+            except (ValueError, TypeError, AttributeError):
+                continue
+            made[key] = (name, arguments)
+        self.prefetcher.finish(speculation, made)
+
+    def estimate_tokens(self, messages: list, tools: bool = True) -> int:
+        """Rough prompt plus answer tokens of a completion, for the token bucket"""
+        chars = len(json.dumps(messages, ensure_ascii=False, default=str))
+        if tools:
+            chars += self.tools_chars
+        return chars // 3 + self.output_tokens
+
+    @staticmethod
+    def turn_priority(messages: list) -> int:
+        """A completion over tool results is the last one of its request and goes first"""
+        last = messages[-1]
+        return FINAL_TURN if isinstance(last, dict) and last.get("role") == "tool" else FIRST_TURN
+
+    async def complete(self, messages: list, usage: TokenUsage = None, **kwargs):
+        """One completion over messages with the tools, recording its token usage"""
+        estimate = self.estimate_tokens(messages)
+        # The span includes the wait for admission, which the queue span shows on its own
+        with span("llm", "completion") as llm:
+            provider, response = await self.providers.complete(
+                estimate,
+                self.turn_priority(messages),
                 messages=messages,
                 tools=self.tools,
-                model=self.model_name,
+                **kwargs,
             )
+            llm.set(provider=provider.name, finish_reason=response.choices[0].finish_reason,
+                    **self.record_usage(response.usage, usage))
+        provider.scheduler.settle(estimate, response.usage.total_tokens if response.usage else 0)
+        return response
 
+    def record_usage(self, response_usage, usage: TokenUsage = None) -> dict:
+        """Add the usage of one completion to the totals, returning it as a dict"""
+        self.usage.add(response_usage)
+        if usage is not None:
+            usage.add(response_usage)
+        single = TokenUsage()
+        single.add(response_usage)
+        counts = single.as_dict()
+        del counts["calls"]
+        count_tokens(counts)
+        return counts
+
+    async def process_message(self, user_message: str, usage: TokenUsage = None, history: list = None):
+        log("message", text=user_message, history_turns=len(history or []))
+
+        # Greetings are answered locally, without an LLM round trip
+        with span("greeting"):
+            greeting = is_greeting(user_message)
+        if greeting:
+            return greeting_completion(self.model_name)
+
+        # Only stateless questions are cached and shared, an answer with history belongs to its conversation
+        if history:
+            return await self.answer(user_message, usage, history)
+
+        if self.answers:
+            cached = await self.answers.get(user_message)
+            if cached is not None:
+                return local_completion(self.model_name, cached)
+
+        if self.chat_flights and fold(user_message):
+            return await self.chat_flights.do(fold(user_message), lambda: self.answer_stateless(user_message, usage))
+        return await self.answer_stateless(user_message, usage)
+
+    async def answer_stateless(self, user_message: str, usage: TokenUsage = None):
+        """Answer a question without conversation context and keep the answer in the answer cache"""
+        if self.answers is None:
+            return await self.answer(user_message, usage)
+
+        trace, token = self.answers.begin()
+        try:
+            response = await self.answer(user_message, usage)
+        finally:
+            self.answers.end(token)
+        if response.choices[0].finish_reason == "stop":
+            await self.answers.set(user_message, response.choices[0].message.content, trace)
         return response
 
+    async def answer(self, user_message: str, usage: TokenUsage = None, history: list = None):
+        # Original system message and logic for non-greeting messages
+        messages = await self.build_messages(user_message, history)
+        speculation = self.speculate(user_message, messages)
+
+        usage = usage if usage is not None else TokenUsage()
+        response = await self.complete(messages, usage)
+
+        if response.choices[0].finish_reason == "tool_calls":
+            message = response.choices[0].message
+            # Run every tool call of this turn concurrently, keep the original order
+            tool_calls = [tool_call.model_dump() for tool_call in message.tool_calls if tool_call.type == "function"]
+            # A plain dict like the stream path builds; the SDK message carries fields such as
+            # refusal that the other provider may get when this history is replayed to it
+            messages.append({"role": "assistant", "content": message.content, "tool_calls": tool_calls})
+            self.finish_speculation(speculation, tool_calls)
+            await self.append_tool_results(messages, tool_calls, speculation)
+
+            response = await self.complete(messages, usage)
+        else:
+            self.finish_speculation(speculation, [])
+
+        log("usage", **usage.as_dict())
+        return response
+
+    async def stream_message(self, user_message: str, usage: TokenUsage = None, history: list = None):
+        """Same flow as process_message, but yields the answer text as the final completion streams in"""
+        log("message", text=user_message, history_turns=len(history or []), stream=True)
+
+        with span("greeting"):
+            greeting = is_greeting(user_message)
+        if greeting:
+            yield GREETING_REPLY
+            return
+
+        cached = await self.answers.get(user_message) if self.answers and not history else None
+        if cached is not None:
+            yield cached
+            return
+
+        messages = await self.build_messages(user_message, history)
+        speculation = self.speculate(user_message, messages)
+
+        # The first turn is streamed as well: when the model answers directly its
+        # tokens go out immediately, when it calls tools the deltas are assembled
+        usage = usage if usage is not None else TokenUsage()
+        tool_calls = []
+        async for content in self.stream_completion(messages, tool_calls, usage):
+            yield content
+
+        self.finish_speculation(speculation, tool_calls)
+        if tool_calls:
+            messages.append({"role": "assistant", "content": None, "tool_calls": tool_calls})
+            await self.append_tool_results(messages, tool_calls, speculation)
+
+            async for content in self.stream_completion(messages, [], usage):
+                yield content
+
+        log("usage", **usage.as_dict())
+
+    async def stream_completion(self, messages: list, tool_calls: list, usage: TokenUsage = None):
+        """Stream one completion, yielding content deltas and collecting tool call deltas into tool_calls"""
+        kwargs = {"stream_options": {"include_usage": True}} if self.stream_usage else {}
+        estimate = self.estimate_tokens(messages)
+        with span("llm", "stream") as llm:
+            start = time.perf_counter()
+            # The stream keeps its concurrency slot until the last chunk
+            async with self.providers.stream(
+                estimate,
+                self.turn_priority(messages),
+                messages=messages,
+                tools=self.tools,
+                **kwargs,
+            ) as (provider, stream):
+                llm.set(provider=provider.name)
+                async for chunk in stream:
+                    # With include_usage the last chunk carries the usage and no choices
+                    if getattr(chunk, "usage", None):
+                        llm.set(**self.record_usage(chunk.usage, usage))
+                        provider.scheduler.settle(estimate, chunk.usage.total_tokens)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if (delta.content or delta.tool_calls) and "first_token_ms" not in llm.fields:
+                        llm.set(first_token_ms=round((time.perf_counter() - start) * 1000, 1))
+                    if delta.content:
+                        yield delta.content
+                    for tool_call_delta in delta.tool_calls or []:
+                        while len(tool_calls) <= tool_call_delta.index:
+                            tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                        tool_call = tool_calls[tool_call_delta.index]
+                        if tool_call_delta.id:
+                            tool_call["id"] = tool_call_delta.id
+                        if tool_call_delta.function:
+                            tool_call["function"]["name"] += tool_call_delta.function.name or ""
+                            tool_call["function"]["arguments"] += tool_call_delta.function.arguments or ""
+
+    async def summarize(self, previous: str, entries: list, max_chars: int) -> str:
+        """Extend a conversation summary with older history entries"""
+        turns = "\n".join(f"Khách: {entry['question']}\nTrợ lý: {entry['answer']}" for entry in entries)
+        messages = [
+            {"role": "system", "content": f"Tóm tắt ngắn gọn cuộc trò chuyện giữa khách và trợ lý của dichvuhungngan, giữ lại tên quán, dịch vụ, giá và nhu cầu của khách. Tối đa {max_chars} ký tự."},
+            {"role": "user", "content": f"Tóm tắt hiện có:\n{previous or '(chưa có)'}\n\nCác lượt mới:\n{turns}"},
+        ]
+        estimate = self.estimate_tokens(messages, tools=False)
+        # Summaries run in the background and yield the quota to waiting users
+        with span("llm", "summary") as llm:
+            provider, response = await self.providers.complete(estimate, BACKGROUND, hedge=False, messages=messages)
+            llm.set(provider=provider.name, **self.record_usage(response.usage))
+        provider.scheduler.settle(estimate, response.usage.total_tokens if response.usage else 0)
+        return response.choices[0].message.content or previous
+
+    async def aclose(self) -> None:
+        if self.index:
+            await self.index.close()
+        await self.catalog.aclose()
+        await self.providers.aclose()
@@ -0,0 +1,51 @@
+import re
+import time
+import uuid
+import unicodedata
+from openai.types.chat import ChatCompletion
+
+GREETINGS = [
+    "xin chào", "hi", "hello", "chào",
+    "bạn có thể giúp cho tôi", "bạn có thể giúp tôi",
+    "cho tôi hỏi", "tôi cần hỏi", "tôi muốn hỏi",
+    "chào bạn", "hey", "có ai không",
+    "bạn ơi", "alo", "giúp tôi", "giúp mình",
+    "mình cần hỏi", "mình muốn hỏi",
+    "chào shop", "shop ơi", "cửa hàng ơi",
+    "có thể giúp mình", "có thể tư vấn"
+]
+
+GREETING_REPLY = "Xin chào anh/chị! Em là trợ lý ảo của dichvuhungngan. Em rất vui được hỗ trợ anh/chị tìm hiểu về các dịch vụ của chúng em ạ."
+
+# All greetings in one alternation, bounded by non-word characters so that
+# "hi" no longer matches inside words like "khi" or "thích"
+GREETING_PATTERN = re.compile(
+    r"(?<!\w)(?:" + "|".join(re.escape(greeting) for greeting in sorted(GREETINGS, key=len, reverse=True)) + r")(?!\w)",
+    re.IGNORECASE,
+)
+
+
+def is_greeting(message: str) -> bool:
+    # Some keyboards send decomposed Vietnamese, the patterns are precomposed
+    return GREETING_PATTERN.search(unicodedata.normalize("NFC", message)) is not None
+
+
+def greeting_completion(model: str) -> ChatCompletion:
+    """Build the greeting reply locally in the same shape as an LLM response"""
+    return local_completion(model, GREETING_REPLY)
+
+
+def local_completion(model: str, content: str) -> ChatCompletion:
+    """Wrap an answer produced without an LLM call in the same shape as an LLM response"""
+    return ChatCompletion.model_validate({
+        "id": f"local-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    })
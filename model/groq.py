@@ -1,10 +1,16 @@
-from groq import Groq
+from groq import AsyncGroq
 import os
+import shutil
+import asyncio
+import hashlib
 from dotenv import load_dotenv
 from fastapi import UploadFile
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
+from store import Cache
+from store.telemetry import span, observe_payload
+from . import audio
+from .scheduler import Scheduler, Overloaded
 
 load_dotenv()
 
@@ -14,50 +20,142 @@ class AudioTranscriptionResponse(BaseModel):
     error: Optional[str] = None
 
 class GroqService:
-    def __init__(self):
+    def __init__(self, redis=None):
         self.api_key = os.getenv("GROQ_API_KEY")
         self.max_file_size = 5 * 1024 * 1024
-        self.client = Groq(api_key=self.api_key)
+        self.chunk_size = 64 * 1024
+        self.client = AsyncGroq(api_key=self.api_key, max_retries=0)
+        # Groq speech-to-text quota, shared by every upload and long-audio segment
+        self.scheduler = Scheduler(
+            "transcription",
+            rpm=float(os.getenv("TRANSCRIPTION_RPM", "20")),
+            concurrency=int(os.getenv("TRANSCRIPTION_CONCURRENCY", "8")),
+            max_wait=float(os.getenv("TRANSCRIPTION_MAX_WAIT", "15")),
+            max_retries=int(os.getenv("TRANSCRIPTION_MAX_RETRIES", "3")),
+        )
+        self.model = "whisper-large-v3"
+        # Uploads over max_file_size are split on silences and transcribed in parallel when ffmpeg is available
+        self.long_audio = os.getenv("LONG_AUDIO_ENABLED", "1") == "1" and shutil.which(audio.FFMPEG) is not None
+        self.long_max_file_size = int(os.getenv("LONG_AUDIO_MAX_SIZE", str(50 * 1024 * 1024)))
+        self.upload_limit = self.long_max_file_size if self.long_audio else self.max_file_size
+        self.segment_seconds = float(os.getenv("LONG_AUDIO_SEGMENT_SECONDS", "30"))
+        self.split_search_seconds = float(os.getenv("LONG_AUDIO_SPLIT_SEARCH_SECONDS", "10"))
+        self.overlap_seconds = float(os.getenv("LONG_AUDIO_OVERLAP_SECONDS", "1"))
+        self.silence_db = float(os.getenv("LONG_AUDIO_SILENCE_DB", "-35"))
+        self.silence_seconds = float(os.getenv("LONG_AUDIO_SILENCE_SECONDS", "0.4"))
+        self.codec = os.getenv("LONG_AUDIO_CODEC", "opus")
+        self.segment_limit = asyncio.Semaphore(int(os.getenv("LONG_AUDIO_CONCURRENCY", "4")))
+        self.stats = {"uploads": 0, "long_uploads": 0, "segments": 0}
+        # Retried uploads and resent voice notes are served by content hash instead of a new API call
+        self.cache_ttl = float(os.getenv("TRANSCRIPT_CACHE_TTL", "86400"))
+        self.cache = None
+        if os.getenv("TRANSCRIPT_CACHE_ENABLED", "1") == "1":
+            self.cache = Cache(
+                "transcripts",
+                max_size=int(os.getenv("TRANSCRIPT_CACHE_SIZE", "256")),
+                redis=redis if os.getenv("TRANSCRIPT_CACHE_REDIS") == "1" else None,
+            )
+
+    async def read_upload(self, file: UploadFile, limit: int) -> Optional[bytes]:
+        """Read the upload in chunks, returning None as soon as it exceeds limit bytes"""
+        # The multipart parser already knows the size when it spooled the upload
+        if file.size is not None and file.size > limit:
+            return None
+        chunks = []
+        size = 0
+        while chunk := await file.read(self.chunk_size):
+            size += len(chunk)
+            if size > limit:
+                return None
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def read_audio(self, file: UploadFile) -> Optional[bytes]:
+        """Read and close the upload, returning None when it is over the size limit"""
+        with span("transcription_upload") as upload:
+            contents = await self.read_upload(file, self.upload_limit)
+            await file.close()
+            upload.set(bytes=len(contents) if contents is not None else None, too_large=contents is None)
+        if contents is not None:
+            observe_payload("transcription_upload", "", len(contents))
+        return contents
 
     async def speech_to_text(self, file: UploadFile):
-        temp_path = None
         try:
-            # Check file size
-            contents = await file.read()
-            await file.close()
+            contents = await self.read_audio(file)
+        except Exception as e:
+            return AudioTranscriptionResponse(
+                success=False,
+                error=f"Lỗi khi xử lý âm thanh: {str(e)}"
+            )
+        return await self.transcribe_audio(contents, file.filename)
 
-            if len(contents) > self.max_file_size:
+    async def transcribe_audio(self, contents: Optional[bytes], filename: Optional[str]) -> AudioTranscriptionResponse:
+        try:
+            # Check file size
+            if contents is None:
                 return AudioTranscriptionResponse(
                     success=False,
-                    error="File âm thanh vượt quá 5MB. Vui lòng ghi âm ngắn hơn."
+                    error=f"File âm thanh vượt quá {self.upload_limit // (1024 * 1024)}MB. Vui lòng ghi âm ngắn hơn."
                 )
 
-            # Save temporary file
-            temp_path = f"temp_{datetime.now().timestamp()}_{file.filename}"
-            with open(temp_path, "wb") as f:
-                f.write(contents)
-
-            # Transcribe using new Groq API
-            with open(temp_path, "rb") as audio_file:
-                transcription = self.client.audio.transcriptions.create(
-                    file=(temp_path, audio_file.read()),
-                    model="whisper-large-v3",
-                    response_format="verbose_json"
+            self.stats["uploads"] += 1
+            if self.cache is None:
+                text = await self.transcribe_upload(contents, filename)
+            else:
+                # Hashed off the event loop, uploads go up to LONG_AUDIO_MAX_SIZE
+                digest = await asyncio.to_thread(lambda: hashlib.sha256(contents).hexdigest())
+                text = await self.cache.get_or_load(
+                    f"{self.model}:{digest}",
+                    lambda: self.transcribe_upload(contents, filename),
+                    ttl=self.cache_ttl,
                 )
 
             return AudioTranscriptionResponse(
                 success=True,
-                data=transcription.text
+                data=text
             )
 
+        except Overloaded:
+            # Answered with 503 and Retry-After instead of a failed transcript
+            raise
         except Exception as e:
             return AudioTranscriptionResponse(
                 success=False,
                 error=f"Lỗi khi xử lý âm thanh: {str(e)}"
             )
-        finally:
-            if temp_path and os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
+
+    async def transcribe_upload(self, contents: bytes, filename: Optional[str]) -> str:
+        if len(contents) > self.max_file_size:
+            return await self.transcribe_long(contents, filename)
+        # Transcribe straight from memory
+        return await self.transcribe((filename or "audio", contents))
+
+    async def transcribe(self, file: tuple) -> str:
+        with span("transcription", self.model, bytes=len(file[1])):
+            transcription = await self.scheduler.run(
+                lambda: self.client.audio.transcriptions.create(
+                    file=file,
+                    model=self.model,
+                    response_format="verbose_json"
+                )
+            )
+        return transcription.text
+
+    async def transcribe_long(self, contents: bytes, filename: Optional[str]) -> str:
+        """Split a long recording on silences and transcribe the segments concurrently"""
+        with span("audio_split") as split:
+            pcm, silences = await audio.decode(contents, filename, self.silence_db, self.silence_seconds)
+            points = audio.split_points(len(pcm) / audio.BYTES_PER_SECOND, silences,
+                                        self.segment_seconds, self.split_search_seconds)
+            segments = audio.segments(pcm, points, self.overlap_seconds)
+            split.set(seconds=round(points[-1], 1), segments=len(segments))
+        self.stats["long_uploads"] += 1
+        self.stats["segments"] += len(segments)
+
+        async def transcribe_segment(segment: bytes) -> str:
+            async with self.segment_limit:
+                return await self.transcribe(await audio.encode(segment, self.codec))
+
+        transcripts = await asyncio.gather(*(transcribe_segment(segment) for segment in segments))
+        return audio.stitch(transcripts)
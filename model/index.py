@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import asyncio
+from dotenv import load_dotenv
+from store.telemetry import log
+from .catalog import CATEGORY_MAP, SERVICE_MAP, BEAUTY_CATEGORY
+from .text import fold
+
+load_dotenv()
+
+CATEGORIES = "/api/v1/categories"
+TOP_FOOD = "/api/v1/main-advertisements/top-food"
+SERVICES = "/api/v1/advertisement-services/category"
+TOP_RESTAURANTS = "/api/v1/main-advertisements/top-restaurants"
+SERVICE_ADS = "/api/v2/main-advertisements/service2"
+TOP_POPULARS = "/api/v2/main-advertisements/top-populars"
+
+
+def compact(value) -> str:
+    """Case, diacritic and separator insensitive form of a name or code, e.g. Trà sữa -> trasua"""
+    return "".join(fold(str(value)).split())
+
+
+def entry_key(path: str, params: dict = None) -> str:
+    return path + "?" + "&".join(f"{name}={compact(value)}" for name, value in sorted((params or {}).items()))
+
+
+class CatalogIndex:
+    """In-memory copy of the catalog endpoints behind the tools, kept fresh by a background sync.
+
+    Responses are stored raw per endpoint and parameters, so the tools read
+    them exactly as they would read the live API. Anything not in the index
+    goes to the live API.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.interval = float(os.getenv("CATALOG_INDEX_INTERVAL", "300"))
+        # Past this age the index is not trusted and calls go to the live API
+        self.max_age = float(os.getenv("CATALOG_INDEX_MAX_AGE", "3600"))
+        # Top rankings are synced this deep and sliced for smaller limits
+        self.top_limit = int(os.getenv("CATALOG_INDEX_TOP_LIMIT", "50"))
+        self.snapshot_path = os.getenv("CATALOG_SNAPSHOT_PATH")
+        self.sync_limit = asyncio.Semaphore(int(os.getenv("CATALOG_INDEX_CONCURRENCY", "8")))
+        self.entries = {}
+        # Compact service name or code -> its synced advertisements, for calls naming the service
+        self._services = {}
+        self.synced_at = 0.0
+        self.task = None
+        self.stats = {"hits": 0, "search_hits": 0, "misses": 0, "syncs": 0, "sync_errors": 0}
+
+    def start(self) -> None:
+        if self.snapshot_path:
+            self.load_snapshot()
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        # A fresh snapshot postpones the first sync
+        await asyncio.sleep(max(0.0, self.synced_at + self.interval - time.time()))
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                self.stats["sync_errors"] += 1
+                log("catalog_sync_failed", "warning", error=str(e))
+            await asyncio.sleep(self.interval)
+
+    async def sync(self) -> None:
+        """Pull every endpoint the tools use; entries that fail to refresh keep their previous value"""
+        entries = {}
+        failures = 0
+
+        async def fetch(path: str, params: dict = None):
+            nonlocal failures
+            async with self.sync_limit:
+                try:
+                    data = await self.catalog.get_json(path, params)
+                except Exception:
+                    failures += 1
+                    return None
+            entries[entry_key(path, params)] = data
+            return data
+
+        category_codes = [code for _, code in CATEGORY_MAP]
+        service_lists, _ = await asyncio.gather(
+            asyncio.gather(*(fetch(SERVICES, {"categoryName": code}) for code in category_codes + [BEAUTY_CATEGORY])),
+            asyncio.gather(
+                fetch(CATEGORIES),
+                fetch(TOP_FOOD),
+                *(fetch(TOP_POPULARS, {"categoryName": code}) for code in category_codes),
+                *(fetch(SERVICE_ADS, {"serviceName": code}) for _, code in SERVICE_MAP),
+            ),
+        )
+        service_ids = {0} | {
+            service["serviceId"]
+            for data in service_lists if data
+            for service in data.get("result") or []
+        }
+        await asyncio.gather(*(
+            fetch(TOP_RESTAURANTS, {"serviceId": service_id, "limit": self.top_limit}) for service_id in service_ids
+        ))
+
+        if not entries:
+            raise RuntimeError(f"all {failures} catalog requests failed")
+        self.entries = {**self.entries, **entries}
+        self.build_search()
+        self.synced_at = time.time()
+        self.stats["syncs"] += 1
+        log("catalog_synced", "warning" if failures else "info", entries=len(entries), failures=failures)
+        if self.snapshot_path:
+            await asyncio.to_thread(self.save_snapshot)
+
+    def build_search(self) -> None:
+        services = {}
+        for key, data in self.entries.items():
+            if key.startswith(SERVICE_ADS + "?") and (data.get("result") or {}).get("responseList"):
+                for ad in data["result"]["responseList"]:
+                    if ad.get("serviceName"):
+                        services.setdefault(compact(ad["serviceName"]), []).append(ad)
+        for name, code in SERVICE_MAP:
+            data = self.entries.get(entry_key(SERVICE_ADS, {"serviceName": code}))
+            if data and (data.get("result") or {}).get("responseList"):
+                services.setdefault(compact(name), data["result"]["responseList"])
+        self._services = services
+
+    def search(self, query: str) -> list:
+        """Advertisements of the service whose whole name is query, ignoring case, diacritics and spacing"""
+        name = compact(query)
+        # Anything shorter is a fragment rather than a service name
+        if len(name) < 3:
+            return []
+        return self._services.get(name, [])
+
+    def lookup(self, path: str, params: dict = None):
+        """The synced response for a catalog call, or None when the live API has to answer it"""
+        if time.time() - self.synced_at > self.max_age:
+            self.stats["misses"] += 1
+            return None
+        params = dict(params or {})
+        limit = None
+        if path == TOP_RESTAURANTS:
+            try:
+                limit = int(params.get("limit") or 10)
+            except (TypeError, ValueError):
+                # Whatever the live API makes of it
+                self.stats["misses"] += 1
+                return None
+            params["limit"] = self.top_limit
+        data = self.entries.get(entry_key(path, params)) if limit is None or limit <= self.top_limit else None
+
+        if data is not None:
+            self.stats["hits"] += 1
+            return data if limit is None else {**data, "result": (data.get("result") or [])[:limit]}
+        if path == SERVICE_ADS and (ads := self.search(params.get("serviceName", ""))):
+            self.stats["search_hits"] += 1
+            return {"result": {"responseList": ads}}
+        self.stats["misses"] += 1
+        return None
+
+    def load_snapshot(self) -> None:
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log("catalog_snapshot_unreadable", "warning", path=self.snapshot_path, error=str(e))
+            return
+        self.entries = snapshot["entries"]
+        self.synced_at = snapshot["synced_at"]
+        self.build_search()
+
+    def save_snapshot(self) -> None:
+        # Write then rename so a crash never leaves a truncated snapshot behind
+        temp = f"{self.snapshot_path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({"synced_at": self.synced_at, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(temp, self.snapshot_path)
+
+    async def close(self) -> None:
+        if self.task:
+            self.task.cancel()
@@ -0,0 +1,89 @@
+import os
+from dotenv import load_dotenv
+from store.telemetry import log
+
+load_dotenv()
+
+class ConversationMemory:
+    """Model context for multi-turn chats: the last few turns verbatim plus a rolling summary of the older ones.
+
+    Turns are read from the conversation's `chat:{id}` history, the summary lives
+    next to it in `chat:{id}:summary` and is extended incrementally, so the
+    prompt stays the same size however long the conversation runs.
+    """
+
+    def __init__(self, store, assistant):
+        self.store = store
+        self.assistant = assistant
+        self.turns = int(os.getenv("CONTEXT_TURNS", "4"))
+        self.turn_chars = int(os.getenv("CONTEXT_TURN_CHARS", "600"))
+        self.summary_chars = int(os.getenv("CONTEXT_SUMMARY_CHARS", "800"))
+        self.updating = set()
+        # Conversations that gained turns while their summary was being updated
+        self.pending = set()
+
+    def clip(self, text: str, limit: int) -> str:
+        return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+    async def context(self, conversation_id: str) -> list:
+        """Messages to put between the system prompt and the new user message"""
+        summary = await self.store.get_summary(conversation_id)
+        recent = await self.store.get_entries(conversation_id, -self.turns) if self.turns else []
+
+        messages = []
+        if summary["text"]:
+            messages.append({"role": "system", "content": f"Tóm tắt cuộc trò chuyện trước đó: {summary['text']}"})
+        for entry in recent:
+            messages.append({"role": "user", "content": self.clip(entry["question"], self.turn_chars)})
+            messages.append({"role": "assistant", "content": self.clip(entry["answer"] or "", self.turn_chars)})
+        return messages
+
+    async def unsummarized(self, conversation_id: str, summary: dict, end: int) -> int:
+        """Index of the first entry the summary does not cover.
+
+        HISTORY_MAX_ENTRIES trims the oldest entries, shifting every index, so the
+        stored index is only trusted while the last summarized entry is still there.
+        """
+        covered, last_id = summary["covered"], summary.get("last_id")
+        if not last_id or end <= 0:
+            return covered
+        if covered <= end and await self.store.get_entry_ids(conversation_id, covered - 1, covered) == [last_id]:
+            return covered
+        ids = await self.store.get_entry_ids(conversation_id, 0, end)
+        # Gone entirely when trimmed away, then every remaining entry is newer
+        return ids.index(last_id) + 1 if last_id in ids else 0
+
+    async def update(self, conversation_id: str, written=None) -> None:
+        """Fold the turns that have left the recent window into the rolling summary.
+
+        written is the HistoryWriter future of the newest turn; the history length
+        counts it only once it is stored.
+        """
+        if written is not None and not await written:
+            return
+        if conversation_id in self.updating:
+            # context() reads a fixed tail, a skipped turn would fall out of both
+            self.pending.add(conversation_id)
+            return
+        self.updating.add(conversation_id)
+        try:
+            summary = await self.store.get_summary(conversation_id)
+            key = self.store.history_key(conversation_id)
+            end = await self.store.history_length(key) - self.turns
+            start = await self.unsummarized(conversation_id, summary, end)
+            if end <= start:
+                return
+            entries = await self.store.get_entries(conversation_id, start, end)
+            text = await self.assistant.summarize(summary["text"], entries, self.summary_chars)
+            await self.store.set_summary(conversation_id, {
+                "text": self.clip(text, self.summary_chars),
+                "covered": end,
+                "last_id": entries[-1]["id"],
+            })
+        except Exception as e:
+            log("summary_update_failed", "warning", conversation_id=conversation_id, error=str(e))
+        finally:
+            self.updating.discard(conversation_id)
+        if conversation_id in self.pending:
+            self.pending.discard(conversation_id)
+            await self.update(conversation_id)
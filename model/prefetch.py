@@ -0,0 +1,122 @@
+import os
+import asyncio
+from collections import Counter
+from dotenv import load_dotenv
+from .text import fold
+
+load_dotenv()
+
+
+def features(message: str) -> set:
+    """Folded words and word pairs of a message; Vietnamese terms often span two syllables"""
+    words = fold(message).split()
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+class Speculation:
+    """Tool calls started for one message before the model asked for them"""
+
+    def __init__(self, message: str):
+        self.message = message
+        # tool cache key -> (task, source)
+        self.calls = {}
+
+    def take(self, key: str):
+        """The running or finished call for key, or None when it was not predicted"""
+        call = self.calls.get(key)
+        return call[0] if call else None
+
+
+class ToolPrefetcher:
+    """Predict a message's tool calls so they run while the tool-selection completion is in flight.
+
+    Candidates are the mapping-table matches of the intent router plus calls
+    the model made often enough for messages sharing a word with this one.
+    Every answered message feeds those statistics, and hit and waste counters
+    tell whether the thresholds prefetch too little or too much.
+    """
+
+    def __init__(self, router=None):
+        self.router = router
+        self.max_calls = int(os.getenv("TOOL_PREFETCH_MAX_CALLS", "3"))
+        # Share of messages with a word that led to a call before it is predicted
+        self.min_score = float(os.getenv("TOOL_PREFETCH_MIN_SCORE", "0.5"))
+        self.min_samples = int(os.getenv("TOOL_PREFETCH_MIN_SAMPLES", "5"))
+        self.max_features = int(os.getenv("TOOL_PREFETCH_MAX_FEATURES", "20000"))
+        # Messages between halvings of every count, so old traffic fades and the tables stay bounded
+        self.decay_every = int(os.getenv("TOOL_PREFETCH_DECAY_EVERY", "1000"))
+        self.learned = 0
+        # feature -> messages seen with it, feature -> Counter of tool cache keys the model then called
+        self.seen = Counter()
+        self.called = {}
+        # tool cache key -> (tool name, arguments) for learned calls
+        self.calls = {}
+        self.stats = {
+            source: {"predicted": 0, "hits": 0, "wasted": 0} for source in ("router", "learned")
+        }
+        self.stats["missed"] = 0
+
+    @property
+    def hit_rate(self) -> float:
+        predicted = sum(self.stats[source]["predicted"] for source in ("router", "learned"))
+        hits = sum(self.stats[source]["hits"] for source in ("router", "learned"))
+        return round(hits / predicted, 4) if predicted else 0.0
+
+    def predict(self, message: str, key) -> list:
+        """Up to max_calls (key, tool name, arguments, source), most likely first; key(name, arguments) gives the cache key"""
+        candidates = {}
+        if self.router:
+            for name, arguments in self.router.matches(message):
+                try:
+                    candidates.setdefault(key(name, arguments), (1.0, name, arguments, "router"))
+                except TypeError:
+                    continue
+        for feature in features(message):
+            count = self.seen.get(feature, 0)
+            if count < self.min_samples:
+                continue
+            for call, hits in self.called.get(feature, {}).items():
+                score = hits / count
+                if score >= self.min_score and score > candidates.get(call, (0,))[0]:
+                    candidates[call] = (score, *self.calls[call], "learned")
+        ranked = sorted(candidates.items(), key=lambda item: item[1][0], reverse=True)[:self.max_calls]
+        return [(call, name, arguments, source) for call, (_, name, arguments, source) in ranked]
+
+    def start(self, message: str, key, call_tool) -> Speculation:
+        """Start the predicted calls of message as tasks running call_tool(name, arguments)"""
+        speculation = Speculation(message)
+        for call, name, arguments, source in self.predict(message, key):
+            task = asyncio.ensure_future(call_tool(name, arguments))
+            # A failed guess is only reported when the model makes the same call
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            speculation.calls[call] = (task, source)
+            self.stats[source]["predicted"] += 1
+        return speculation
+
+    def finish(self, speculation: Speculation, made: dict) -> None:
+        """Score the speculation against the calls the model made (key -> (name, arguments)) and learn from them"""
+        for call, (_, source) in speculation.calls.items():
+            self.stats[source]["hits" if call in made else "wasted"] += 1
+        self.stats["missed"] += len(made.keys() - speculation.calls.keys())
+
+        for feature in features(speculation.message):
+            if feature not in self.seen and len(self.seen) >= self.max_features:
+                continue
+            self.seen[feature] += 1
+            for call in made:
+                self.called.setdefault(feature, Counter())[call] += 1
+        self.calls.update(made)
+        self.learned += 1
+        if self.decay_every > 0 and self.learned % self.decay_every == 0:
+            self.decay()
+
+    def decay(self) -> None:
+        """Halve every count, forgetting the features and calls that drop to zero"""
+        self.seen = Counter({feature: count // 2 for feature, count in self.seen.items() if count > 1})
+        called = {}
+        for feature, calls in self.called.items():
+            calls = Counter({call: hits // 2 for call, hits in calls.items() if hits > 1})
+            if feature in self.seen and calls:
+                called[feature] = calls
+        self.called = called
+        self.calls = {call: self.calls[call] for calls in called.values() for call in calls}
@@ -0,0 +1,250 @@
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+from store.telemetry import log
+from .scheduler import Scheduler
+
+load_dotenv()
+
+# name -> how to reach it; env_prefix names the quota settings of its scheduler
+PROVIDERS = {
+    "github": {
+        "base_url": lambda: os.getenv("GITHUB_MODELS_ENDPOINT", "https://models.inference.ai.azure.com"),
+        "api_key": "GITHUB_TOKEN",
+        "model": lambda: os.getenv("GITHUB_MODEL", "gpt-4o-mini"),
+        "env_prefix": "LLM",
+        "limits": {"RPM": "15", "TPM": "0", "CONCURRENCY": "5"},
+    },
+    "groq": {
+        "base_url": lambda: os.getenv("GROQ_BASE_URL", "https://api.groq.com").rstrip("/") + "/openai/v1",
+        "api_key": "GROQ_API_KEY",
+        "model": lambda: os.getenv("GROQ_CHAT_MODEL", "llama-3.3-70b-versatile"),
+        "env_prefix": "GROQ_CHAT",
+        "limits": {"RPM": "30", "TPM": "12000", "CONCURRENCY": "5"},
+    },
+}
+
+
+class Provider:
+    """One OpenAI-compatible chat endpoint with its own quota and latency history"""
+
+    def __init__(self, name: str, client: AsyncOpenAI, model: str, scheduler: Scheduler, window: int = 200):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.scheduler = scheduler
+        # kind -> seconds of recent successful calls: "completion" until the full answer, "stream" until the first chunk
+        self.latencies = {"completion": deque(maxlen=window), "stream": deque(maxlen=window)}
+        self.stats = {"calls": 0, "errors": 0, "wins": 0}
+
+    @classmethod
+    def from_env(cls, name: str):
+        """The provider configured under name, or None without credentials"""
+        config = PROVIDERS[name]
+        api_key = os.getenv(config["api_key"])
+        if not api_key:
+            return None
+        prefix = config["env_prefix"]
+        limits = config["limits"]
+        scheduler = Scheduler(
+            name,
+            rpm=float(os.getenv(f"{prefix}_RPM", limits["RPM"])),
+            tpm=float(os.getenv(f"{prefix}_TPM", limits["TPM"])),
+            concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", limits["CONCURRENCY"])),
+            max_wait=float(os.getenv(f"{prefix}_MAX_WAIT", "10")),
+            max_retries=int(os.getenv(f"{prefix}_MAX_RETRIES", "3")),
+        )
+        # Rate-limited calls are retried by the scheduler, which knows about the other queued calls
+        client = AsyncOpenAI(base_url=config["base_url"](), api_key=api_key, max_retries=0)
+        return cls(name, client, config["model"](), scheduler)
+
+    def percentile(self, kind: str, q: float):
+        latencies = sorted(self.latencies[kind])
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def snapshot(self) -> dict:
+        latency = {}
+        for kind, values in self.latencies.items():
+            if values:
+                latency[kind] = {f"p{round(q * 100)}": round(self.percentile(kind, q) * 1000, 1) for q in (0.5, 0.95, 0.99)}
+        return {**self.stats, "model": self.model, "latency_ms": latency, "scheduler": self.scheduler.snapshot()}
+
+
+class ProviderPool:
+    """Chat completions from the first of several providers to answer.
+
+    The preferred provider gets the request; when it has not answered
+    within its own hedge_quantile latency a backup request goes to the next
+    provider, the first to answer wins and the other is cancelled. A failing
+    provider hands the request over to the next one.
+    """
+
+    def __init__(self, providers: list):
+        self.providers = providers
+        self.hedging = os.getenv("LLM_HEDGE", "1") == "1" and len(providers) > 1
+        self.hedge_quantile = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+        # Used until a provider has min_samples latencies of a kind
+        self.hedge_delay_default = float(os.getenv("LLM_HEDGE_DELAY", "3"))
+        self.hedge_delay_min = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.3"))
+        self.min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    @classmethod
+    def from_env(cls):
+        names = [name.strip() for name in os.getenv("LLM_PROVIDERS", "github,groq").split(",") if name.strip()]
+        providers = [provider for provider in map(Provider.from_env, names) if provider]
+        if not providers:
+            raise RuntimeError(f"No credentials for any of the LLM providers {names}")
+        return cls(providers)
+
+    @property
+    def primary(self) -> Provider:
+        return self.providers[0]
+
+    def hedge_delay(self, provider: Provider, kind: str) -> float:
+        if len(provider.latencies[kind]) < self.min_samples:
+            return self.hedge_delay_default
+        return max(self.hedge_delay_min, provider.percentile(kind, self.hedge_quantile))
+
+    async def timed(self, provider: Provider, kind: str, start):
+        """start(provider, clock), timed from when the scheduler admits the create() wrapped by clock"""
+        provider.stats["calls"] += 1
+        # Time spent queued for our own quota is not the provider's latency; a retry restarts the clock
+        begin = None
+
+        def clock(create):
+            def admitted():
+                nonlocal begin
+                begin = time.perf_counter()
+                return create()
+
+            return admitted
+
+        try:
+            result = await start(provider, clock)
+        except asyncio.CancelledError:
+            # A call cancelled for a faster one took at least this long; leaving it
+            # out would drag the percentile, and with it the hedge delay, down
+            if begin is not None:
+                provider.latencies[kind].append(time.perf_counter() - begin)
+            raise
+        provider.latencies[kind].append(time.perf_counter() - begin)
+        return result
+
+    @staticmethod
+    def discard(task: asyncio.Task, release=None) -> None:
+        """Cancel a losing call, releasing what it opened if it finished anyway"""
+        task.cancel()
+
+        def finished(task: asyncio.Task) -> None:
+            if task.cancelled():
+                return
+            if task.exception() is None and release:
+                asyncio.ensure_future(release(task.result()))
+
+        task.add_done_callback(finished)
+
+    async def race(self, start, kind: str, hedge: bool = True, release=None) -> tuple:
+        """(provider, start(provider, clock)) of the first provider to succeed"""
+        self.stats["requests"] += 1
+        waiting = list(self.providers)
+        primary = waiting.pop(0)
+        pending = {}
+        errors = []
+        hedge = hedge and self.hedging
+        hedged = False
+
+        def launch(provider: Provider) -> None:
+            pending[asyncio.ensure_future(self.timed(provider, kind, start))] = provider
+
+        launch(primary)
+        try:
+            while pending:
+                timeout = self.hedge_delay(primary, kind) if hedge and not hedged and waiting else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.stats["hedged"] += 1
+                    launch(waiting.pop(0))
+                    continue
+                winner = None
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is not None:
+                        provider.stats["errors"] += 1
+                        errors.append(task.exception())
+                        log("provider_failed", "warning", provider=provider.name, error=repr(task.exception()))
+                    elif winner is None:
+                        winner = provider, task.result()
+                    else:
+                        self.discard(task, release)
+                if winner:
+                    winner[0].stats["wins"] += 1
+                    if hedged and winner[0] is not primary:
+                        self.stats["hedge_wins"] += 1
+                    return winner
+                if not pending and waiting:
+                    self.stats["failovers"] += 1
+                    # The next provider takes over alone, hedging is measured against the primary
+                    hedge = False
+                    launch(waiting.pop(0))
+            # The preferred provider's error, e.g. Overloaded, is the one to report
+            raise errors[0]
+        finally:
+            for task in pending:
+                self.discard(task, release)
+
+    async def complete(self, tokens: float, priority: int, hedge: bool = True, **kwargs) -> tuple:
+        """(provider, completion) for kwargs of chat.completions.create, without the model"""
+        def start(provider: Provider, clock):
+            return provider.scheduler.run(
+                clock(lambda: provider.client.chat.completions.create(model=provider.model, **kwargs)),
+                tokens,
+                priority,
+            )
+
+        return await self.race(start, "completion", hedge)
+
+    @asynccontextmanager
+    async def stream(self, tokens: float, priority: int, **kwargs):
+        """(provider, chunks) of a streamed completion, hedged on the time to the first chunk"""
+        async def start(provider: Provider, clock):
+            @clock
+            def create():
+                return provider.client.chat.completions.create(model=provider.model, stream=True, **kwargs)
+
+            stack = AsyncExitStack()
+            try:
+                # The stream keeps its concurrency slot until it is closed
+                stream = await stack.enter_async_context(provider.scheduler.request(create, tokens, priority))
+                stack.push_async_callback(stream.close)
+                first = await anext(stream)
+            except BaseException:
+                await stack.aclose()
+                raise
+            return stack, stream, first
+
+        async def release(opened: tuple) -> None:
+            await opened[0].aclose()
+
+        provider, (stack, stream, first) = await self.race(start, "stream", release=release)
+
+        async def chunks():
+            yield first
+            async for chunk in stream:
+                yield chunk
+
+        try:
+            yield provider, chunks()
+        finally:
+            await stack.aclose()
+
+    async def aclose(self) -> None:
+        for provider in self.providers:
+            await provider.client.close()
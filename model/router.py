@@ -0,0 +1,82 @@
+import re
+from .catalog import CATEGORY_MAP, SERVICE_MAP, BEAUTY_KEYWORDS, BEAUTY_CATEGORY, INTENT_KEYWORDS, NO_TOOL_KEYWORDS
+from .text import fold, words
+
+
+def alias_pattern(aliases) -> re.Pattern:
+    """One alternation over aliases, longest first so the most specific alias wins"""
+    return re.compile(r"\b(?:" + "|".join(re.escape(alias) for alias in sorted(aliases, key=len, reverse=True)) + r")\b")
+
+
+class IntentRouter:
+    """Resolve a message to a single tool call from the catalog mapping tables, without asking the LLM.
+
+    Messages are matched with their diacritics, folding "tốc" and "tóc" or
+    "hai sản phẩm" and "hải sản" together would misroute ordinary sentences.
+    Only a message typed without any diacritics is matched folded.
+    """
+
+    def __init__(self):
+        # alias -> (tool name, arguments), with and without diacritics; later tables
+        # override earlier ones, so the beauty keywords win like they do in the system prompt
+        self.aliases = {}
+        self.folded_aliases = {}
+
+        def add(alias: str, intent: tuple) -> None:
+            self.aliases[words(alias)] = intent
+            self.folded_aliases[fold(alias)] = intent
+
+        for name, code in CATEGORY_MAP:
+            add(name, ("get_service", {"category_name": code}))
+        for name, code in SERVICE_MAP:
+            add(name, ("get_service_advertisements", {"service_name": code}))
+            add(code, ("get_service_advertisements", {"service_name": code}))
+        for tool, keywords in INTENT_KEYWORDS.items():
+            for keyword in keywords:
+                add(keyword, (tool, {}))
+        for keyword in BEAUTY_KEYWORDS:
+            add(keyword, ("get_service", {"category_name": BEAUTY_CATEGORY}))
+
+        # Names and codes of the mapping tables -> code, to resolve tool arguments
+        self.codes = {"category_name": {}, "service_name": {}}
+        for parameter, table in (("category_name", CATEGORY_MAP), ("service_name", SERVICE_MAP)):
+            for name, code in table:
+                self.codes[parameter][fold(name)] = code
+                self.codes[parameter][fold(code)] = code
+
+        self.pattern = alias_pattern(self.aliases)
+        self.folded_pattern = alias_pattern(self.folded_aliases)
+        self.no_tool_pattern = alias_pattern(words(keyword) for keyword in NO_TOOL_KEYWORDS)
+        self.folded_no_tool_pattern = alias_pattern(fold(keyword) for keyword in NO_TOOL_KEYWORDS)
+        self.stats = {"routed": 0, "ambiguous": 0, "unmatched": 0}
+
+    def matches(self, message: str) -> list:
+        """Every (tool name, arguments) the message mentions, in order of appearance"""
+        text = words(message)
+        if text.isascii():
+            return [self.folded_aliases[match.group(0)] for match in self.folded_pattern.finditer(text)]
+        return [self.aliases[match.group(0)] for match in self.pattern.finditer(text)]
+
+    def route(self, message: str):
+        """Return (tool name, arguments) when the message resolves to exactly one tool call, otherwise None"""
+        text = words(message)
+        if (self.folded_no_tool_pattern if text.isascii() else self.no_tool_pattern).search(text):
+            self.stats["unmatched"] += 1
+            return None
+
+        intents = {}
+        for tool, arguments in self.matches(message):
+            intents[(tool, tuple(sorted(arguments.items())))] = (tool, arguments)
+
+        if len(intents) != 1:
+            self.stats["ambiguous" if intents else "unmatched"] += 1
+            return None
+        self.stats["routed"] += 1
+        return next(iter(intents.values()))
+
+    def resolve_codes(self, arguments: dict) -> dict:
+        """Replace category and service names in tool arguments by their codes, leaving unknown values as they are"""
+        return {
+            name: self.codes[name].get(fold(value), value) if name in self.codes and isinstance(value, str) else value
+            for name, value in arguments.items()
+        }
@@ -0,0 +1,229 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from store.telemetry import span, log
+
+# Lower runs first: a turn formatting tool results finishes a request that already spent a completion
+FINAL_TURN = 0
+FIRST_TURN = 1
+BACKGROUND = 2
+
+
+class Overloaded(Exception):
+    """The upstream quota cannot take the call within the queue deadline"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"upstream busy, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """per_minute units refilling continuously, bursting up to one minute's worth"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until amount units are available"""
+        self.refill(now)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        # Going below zero is allowed, an underestimated call is paid back by the next ones
+        self.level -= amount
+
+
+def retry_after(error: Exception):
+    """Seconds the upstream asked to wait in a rate-limit response, or None"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(headers["retry-after"]).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+class Scheduler:
+    """Admission control for one upstream quota.
+
+    Calls queue by priority and are admitted while the request and token
+    buckets and the concurrency limit allow. A call that would wait longer
+    than max_wait is rejected with Overloaded right away instead of piling
+    up, and rate-limit responses pause the whole queue for their Retry-After.
+
+    rpm, tpm and concurrency are the limits of the whole deployment. Every
+    server process holds its own scheduler, so each one gets an equal share
+    of them by the WEB_CONCURRENCY worker count (the variable uvicorn reads
+    for --workers); set it to the number of processes sharing the quota.
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, concurrency: int = 0,
+                 max_wait: float = 10, max_retries: int = 3, backoff: float = 1):
+        self.name = name
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+        self.requests = TokenBucket(rpm / workers) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm / workers) if tpm > 0 else None
+        self.concurrency = max(1, concurrency // workers) if concurrency > 0 else 0
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.active = 0
+        self.paused_until = 0.0
+        self._queue = []
+        self._order = itertools.count()
+        self._timer = None
+        self.stats = {"admitted": 0, "shed": 0, "rate_limited": 0, "retries": 0}
+
+    def expected_wait(self, tokens: float, priority: int) -> float:
+        """Rough seconds until a new call is admitted, from the quota the calls ahead of it need"""
+        now = time.monotonic()
+        ahead = [entry for entry in self._queue if entry[0] <= priority and not entry[3].done()]
+        wait = self.paused_until - now
+        if self.requests:
+            wait = max(wait, self.requests.delay(len(ahead) + 1, now))
+        if self.tokens:
+            wait = max(wait, self.tokens.delay(sum(entry[2] for entry in ahead) + tokens, now))
+        return max(0.0, wait)
+
+    def dispatch(self) -> None:
+        """Admit queued calls in priority order until a limit is reached"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            _, _, tokens, waiter = self._queue[0]
+            if waiter.done():
+                heapq.heappop(self._queue)
+                continue
+            if self.concurrency and self.active >= self.concurrency:
+                # release() dispatches again
+                return
+            now = time.monotonic()
+            delay = self.paused_until - now
+            if self.requests:
+                delay = max(delay, self.requests.delay(1, now))
+            if self.tokens:
+                delay = max(delay, self.tokens.delay(tokens, now))
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self.dispatch)
+                return
+            heapq.heappop(self._queue)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            self.active += 1
+            waiter.set_result(None)
+
+    async def acquire(self, tokens: float, priority: int, order: int) -> None:
+        if self.tokens:
+            tokens = min(tokens, self.tokens.capacity)
+        expected = self.expected_wait(tokens, priority)
+        if expected > self.max_wait:
+            self.stats["shed"] += 1
+            raise Overloaded(expected)
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, order, tokens, waiter))
+        self.dispatch()
+        try:
+            with span("queue", self.name):
+                await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self.stats["shed"] += 1
+                raise Overloaded(self.expected_wait(tokens, priority)) from None
+        except asyncio.CancelledError:
+            # Admitted just as the caller went away, hand the slot on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            waiter.cancel()
+            raise
+        self.stats["admitted"] += 1
+
+    def release(self) -> None:
+        self.active -= 1
+        self.dispatch()
+
+    def settle(self, estimated: float, actual: float) -> None:
+        """Correct the token bucket once the real usage of an admitted call is known"""
+        if self.tokens and actual:
+            self.tokens.take(actual - min(estimated, self.tokens.capacity))
+
+    def retry_delay(self, error: Exception, attempt: int) -> float:
+        """Seconds to wait before retrying error, raising when it should not be retried"""
+        status = getattr(error, "status_code", None)
+        if status not in (429, 503):
+            raise error
+        self.stats["rate_limited"] += 1
+        delay = retry_after(error)
+        if delay is None:
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+        if status == 429:
+            # The quota is shared, every queued call waits out the limit instead of hitting it again
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        log("rate_limited", "warning", upstream=self.name, status=status, retry_after=round(delay, 2), attempt=attempt)
+        if attempt >= self.max_retries or delay > self.max_wait:
+            raise Overloaded(delay) from error
+        return delay
+
+    @asynccontextmanager
+    async def request(self, create, tokens: float = 0, priority: int = FIRST_TURN):
+        """Admit and await create(), retrying rate-limited attempts; the slot is held until the block exits"""
+        order = next(self._order)
+        attempt = 0
+        while True:
+            await self.acquire(tokens, priority, order)
+            try:
+                result = await create()
+            except BaseException as e:
+                # Cancelled calls, e.g. the loser of a hedged request, give their slot back too
+                self.release()
+                if not isinstance(e, Exception):
+                    raise
+                delay = self.retry_delay(e, attempt)
+            else:
+                break
+            attempt += 1
+            self.stats["retries"] += 1
+            if self.paused_until <= time.monotonic():
+                await asyncio.sleep(delay)
+        try:
+            yield result
+        finally:
+            self.release()
+
+    async def run(self, create, tokens: float = 0, priority: int = FIRST_TURN):
+        """Result of create() once admitted, for calls that finish when they return"""
+        async with self.request(create, tokens, priority) as result:
+            return result
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "active": self.active,
+            "queued": sum(not entry[3].done() for entry in self._queue),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+        }
@@ -0,0 +1,38 @@
+import asyncio
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one in-flight call.
+
+    With a window, a finished result keeps being shared with callers that
+    arrive up to window seconds after it completed.
+    """
+
+    def __init__(self, window: float = 0):
+        self.window = window
+        self._calls = {}
+        self.stats = {"calls": 0, "collapsed": 0}
+
+    async def do(self, key: str, loader):
+        """Return loader()'s result, sharing it with every concurrent caller of key"""
+        task = self._calls.get(key)
+        if task is not None:
+            self.stats["collapsed"] += 1
+        else:
+            self.stats["calls"] += 1
+            task = asyncio.ensure_future(loader())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._finished(key, task))
+        # A caller that goes away must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Future) -> None:
+        # Failures are never kept for the window, the next caller retries
+        if self.window and not task.cancelled() and task.exception() is None:
+            asyncio.get_running_loop().call_later(self.window, self._forget, key, task)
+        else:
+            self._forget(key, task)
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
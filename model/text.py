@@ -0,0 +1,14 @@
+import re
+import unicodedata
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip Vietnamese diacritics and collapse everything but letters and digits to single spaces"""
+    text = unicodedata.normalize("NFD", text.lower()).replace("đ", "d")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def words(text: str) -> str:
+    """Lowercase and collapse everything but letters and digits to single spaces, keeping the diacritics"""
+    return " ".join(re.findall(r"[^\W_]+", unicodedata.normalize("NFC", text.lower())))
@@ -0,0 +1,30 @@
+class TokenUsage:
+    """Prompt and completion tokens reported by the provider, summed over completions"""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+    def add(self, usage) -> None:
+        """Add the `usage` of one completion response or final stream chunk"""
+        if usage is None:
+            return
+        self.calls += 1
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.completion_tokens += usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens += getattr(details, "cached_tokens", None) or 0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+        }
+
+    def header(self) -> str:
+        """Compact form for the X-Token-Usage response header"""
+        return ", ".join(f"{name}={value}" for name, value in self.as_dict().items())
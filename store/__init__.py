@@ -1,39 +1,159 @@
-from redis import Redis
+from redis.asyncio import Redis, BlockingConnectionPool
 from dotenv import load_dotenv
 import os
 from datetime import datetime
 import uuid
+from .cache import Cache
+from .writer import HistoryWriter
+from . import telemetry
 
 load_dotenv()
 
+__all__ = ["RedisStore", "Cache", "HistoryWriter", "telemetry", "connection_pool"]
+
+_pool = None
+
+def connection_pool() -> BlockingConnectionPool:
+    """Async connection pool shared by every Redis client in the process"""
+    global _pool
+    if _pool is None:
+        _pool = BlockingConnectionPool(
+            host=os.getenv("REDIS_HOST"),
+            port=os.getenv("REDIS_PORT"),
+            db=0,
+            password=os.getenv("REDIS_PASSWORD"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+            timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "5")),
+        )
+    return _pool
+
+def stamp(moment: datetime) -> str:
+    """moment in the format of the entry timestamps, which are naive local time"""
+    if moment.tzinfo:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
 class RedisStore:
 
     def __init__(self, key: str = "chat"):
         self._key = key
-        self.redis = Redis(host=os.getenv("REDIS_HOST"), port=os.getenv("REDIS_PORT"), db=0, password=os.getenv("REDIS_PASSWORD"))
+        self.redis = Redis(connection_pool=connection_pool())
+        # Keep only the newest entries of each history array, 0 keeps everything
+        self.max_entries = int(os.getenv("HISTORY_MAX_ENTRIES", "0"))
+
+    async def get_history(self) -> str:
+        return await self.redis.json().get(self._key)
+
+    async def get_history_by_id(self, id: str) -> str:
+        return await self.redis.json().get(self.history_key(id))
+
+    async def get_history_page(self, id: str = None, cursor: str = None, limit: int = 50,
+                               since: datetime = None, until: datetime = None) -> tuple:
+        """Return (entries, next_cursor) for the newest entries of a history array older than cursor.
+
+        Pages run backward from the newest entry in range, each one oldest first.
+        A cursor names an entry by its timestamp and id, so it stays valid when
+        HISTORY_MAX_ENTRIES trims the array; next_cursor is None once the range
+        is exhausted. since/until bound the entry timestamps inclusively.
+        """
+        key = self.history_key(id)
+        start, end = await self.history_range(key, since, until)
+        if cursor:
+            end = min(end, await self.locate(key, cursor))
+        begin = max(start, end - limit)
+        if begin >= end:
+            return [], None
+        entries = await self.redis.json().get(key, f"$[{begin}:{end}]")
+        return entries, self.cursor(entries[0]) if begin > start else None
+
+    @staticmethod
+    def cursor(entry: dict) -> str:
+        return f"{entry['timestamp']}|{entry['id']}"
+
+    async def locate(self, key: str, cursor: str) -> int:
+        """Index of the entry a cursor names, 0 once it has been trimmed away with everything older"""
+        timestamp, _, entry_id = cursor.rpartition("|")
+        length = await self.history_length(key)
+        low = await self.bisect(key, length, timestamp)
+        high = await self.bisect(key, length, timestamp, right=True)
+        ids = await self.redis.json().get(key, f"$[{low}:{high}].id") or []
+        return low + ids.index(entry_id) if entry_id in ids else low
 
-    def get_history(self) -> str:
-        return self.redis.json().get(self._key)
+    async def iter_history(self, id: str = None, since: datetime = None, until: datetime = None, batch: int = 500):
+        """Yield history entries in order, fetching one slice at a time"""
+        key = self.history_key(id)
+        start, end = await self.history_range(key, since, until)
+        for begin in range(start, end, batch):
+            for entry in await self.redis.json().get(key, f"$[{begin}:{min(begin + batch, end)}]") or []:
+                yield entry
 
-    def get_history_by_id(self, id: str) -> str:
-        key = f"{self._key}:{id}"
-        return self.redis.json().get(key)
+    async def history_range(self, key: str, since: datetime = None, until: datetime = None) -> tuple:
+        """Index range [start, end) of the entries between since and until"""
+        length = await self.history_length(key)
+        start = await self.bisect(key, length, stamp(since)) if since else 0
+        end = await self.bisect(key, length, stamp(until), right=True) if until else length
+        return start, end
 
-    def save_history(self, question: str, answer: str, id: str = None) -> None:
-        key = f"{self._key}:{id}" if id else self._key
-        chat_history = self.redis.json().get(key)
-        if not chat_history:
-            chat_history = []
-        
+    async def history_length(self, key: str) -> int:
+        # JSON.ARRLEN errors on a missing key instead of returning 0
+        lengths = await self.redis.json().arrlen(key, "$") if await self.redis.exists(key) else None
+        return lengths[0] if lengths and lengths[0] else 0
+
+    async def get_entries(self, id: str, start: int, stop: int = None) -> list:
+        """Entries [start, stop) of a history array; negative indices count from the end"""
+        stop = "" if stop is None else stop
+        return await self.redis.json().get(self.history_key(id), f"$[{start}:{stop}]") or []
+
+    async def get_entry_ids(self, id: str, start: int, stop: int) -> list:
+        """Ids of entries [start, stop) of a history array"""
+        return await self.redis.json().get(self.history_key(id), f"$[{start}:{stop}].id") or []
+
+    async def get_summary(self, id: str) -> dict:
+        """Rolling summary of a conversation: {"text": ..., "covered": index after the last summarized entry, "last_id": its id}"""
+        return await self.redis.json().get(f"{self.history_key(id)}:summary") or {"text": "", "covered": 0}
+
+    async def set_summary(self, id: str, summary: dict) -> None:
+        await self.redis.json().set(f"{self.history_key(id)}:summary", "$", summary)
+
+    async def bisect(self, key: str, length: int, timestamp: str, right: bool = False) -> int:
+        """Binary search over the append-ordered timestamps, one small read per step"""
+        low, high = 0, length
+        while low < high:
+            middle = (low + high) // 2
+            value = (await self.redis.json().get(key, f"$[{middle}].timestamp"))[0]
+            if value < timestamp or (right and value == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def history_key(self, id: str = None) -> str:
+        return f"{self._key}:{id}" if id else self._key
+
+    def new_entry(self, question: str, answer: str) -> dict:
         # Tạo message_id unique cho mỗi tin nhắn
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        chat_history.append({
-            "id": message_id,
+        return {
+            "id": str(uuid.uuid4()),
             "question": question,
             "answer": answer,
-            "timestamp": timestamp
-        })
-        
-        self.redis.json().set(key, "$", chat_history)
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def queue_append(self, pipe, key: str, entry: dict) -> None:
+        """Queue an O(1) append of entry to the history array at key on a pipeline"""
+        # Creates the array on first use; existing arrays, including the legacy
+        # `chat` key, keep their format and are appended to in place
+        pipe.json().set(key, "$", [], nx=True)
+        pipe.json().arrappend(key, "$", entry)
+        if self.max_entries:
+            pipe.json().arrtrim(key, "$", -self.max_entries, -1)
+
+    async def save_history(self, question: str, answer: str, id: str = None) -> None:
+        # MULTI/EXEC keeps concurrent appends to the same key from interleaving
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self.queue_append(pipe, self.history_key(id), self.new_entry(question, answer))
+            await pipe.execute()
+
+    async def aclose(self) -> None:
+        await self.redis.aclose()
+        await self.redis.connection_pool.disconnect()
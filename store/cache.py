@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+import json
+import time
+from collections import OrderedDict
+
+
+class Cache:
+    """Bounded in-process LRU cache with TTLs, stale-while-revalidate and an optional shared Redis tier.
+
+    Values must be JSON serializable when the Redis tier is enabled.
+    """
+
+    def __init__(self, namespace: str, max_size: int = 1024, redis=None):
+        self._namespace = namespace
+        self._max_size = max_size
+        self._redis = redis
+        # key -> (value, expires_at, stale_until), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._refreshing = {}
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "redis_errors": 0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups answered from the cache, stale answers included"""
+        hits = self.stats["hits"] + self.stats["stale_hits"]
+        total = hits + self.stats["misses"]
+        return round(hits / total, 4) if total else 0.0
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self._namespace}:{key}"
+
+    def _store(self, key: str, value, expires_at: float, stale_until: float) -> None:
+        self._entries[key] = (value, expires_at, stale_until)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def _lookup(self, key: str):
+        """Return (value, expires_at, stale_until) from memory or Redis, or None"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry and entry[2] > now:
+            self._entries.move_to_end(key)
+            return entry
+        if entry:
+            del self._entries[key]
+
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(self._redis_key(key))
+        except Exception:
+            self.stats["redis_errors"] += 1
+            return None
+        if not raw:
+            return None
+        data = json.loads(raw)
+        entry = (data["value"], data["expires_at"], data["stale_until"])
+        if entry[2] <= now:
+            return None
+        self.stats["redis_hits"] += 1
+        self._store(key, *entry)
+        return entry
+
+    async def get(self, key: str):
+        """Return the fresh value for key, or None"""
+        entry = await self._lookup(key)
+        if entry and entry[1] > time.time():
+            self.stats["hits"] += 1
+            return entry[0]
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value, ttl: float, stale_ttl: float = 0) -> None:
+        expires_at = time.time() + ttl
+        stale_until = expires_at + stale_ttl
+        self._store(key, value, expires_at, stale_until)
+        if self._redis is None:
+            return
+        payload = json.dumps({"value": value, "expires_at": expires_at, "stale_until": stale_until}, ensure_ascii=False)
+        try:
+            await self._redis.set(self._redis_key(key), payload, px=int((ttl + stale_ttl) * 1000))
+        except Exception:
+            self.stats["redis_errors"] += 1
+
+    async def get_or_load(self, key: str, loader, ttl: float, stale_ttl: float = 0):
+        """Return the cached value for key, calling loader() on a miss.
+
+        A value past its TTL but still inside stale_ttl is returned as is while
+        loader() refreshes it in the background.
+        """
+        entry = await self._lookup(key)
+        if entry:
+            value, expires_at, _ = entry
+            if expires_at > time.time():
+                self.stats["hits"] += 1
+            else:
+                self.stats["stale_hits"] += 1
+                self._refresh(key, loader, ttl, stale_ttl)
+            return value
+
+        self.stats["misses"] += 1
+        value = await loader()
+        await self.set(key, value, ttl, stale_ttl)
+        return value
+
+    def _refresh(self, key: str, loader, ttl: float, stale_ttl: float) -> None:
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                value = await loader()
+                await self.set(key, value, ttl, stale_ttl)
+                self.stats["refreshes"] += 1
+            except Exception:
+                self.stats["refresh_errors"] += 1
+            finally:
+                self._refreshing.pop(key, None)
+
+        # A fresh context keeps the refresh out of the request that happened to trigger it
+        self._refreshing[key] = asyncio.create_task(refresh(), context=contextvars.Context())
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+load_dotenv()
+
+STAGE_SECONDS = Histogram(
+    "uiclient_stage_seconds", "Time spent in one stage of a request",
+    ["stage", "name"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUEST_SECONDS = Histogram(
+    "uiclient_http_request_seconds", "Time until the response headers are sent",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+PAYLOAD_BYTES = Histogram(
+    "uiclient_payload_bytes", "Size of tool results and audio uploads",
+    ["stage", "name"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 5242880, 52428800),
+)
+LLM_TOKENS = Counter("uiclient_llm_tokens", "Tokens reported by the LLM provider", ["kind"])
+
+# Share of requests whose info logs are written; warnings and errors are always written
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+logger = logging.getLogger("uiclient")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+_request = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """Spans of one HTTP request, for its Server-Timing header and log correlation"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        # Sampling per request keeps every log line of a sampled request
+        self.sampled = random.random() < LOG_SAMPLE_RATE
+        self.spans = []
+
+    def server_timing(self, total: float) -> str:
+        stages = {}
+        for stage, duration in self.spans:
+            count, summed = stages.get(stage, (0, 0.0))
+            stages[stage] = (count + 1, summed + duration)
+        parts = [f'{stage};dur={summed * 1000:.1f};desc="{count}x"' for stage, (count, summed) in stages.items()]
+        return ", ".join(parts + [f"total;dur={total * 1000:.1f}"])
+
+
+def begin_request() -> tuple:
+    trace = RequestTrace()
+    return trace, _request.set(trace)
+
+
+def end_request(token) -> None:
+    _request.reset(token)
+
+
+def log(event: str, level: str = "info", **fields) -> None:
+    """Write one JSON log line; info and debug lines are sampled"""
+    trace = _request.get()
+    levelno = logging.getLevelName(level.upper())
+    if levelno < logging.WARNING and not (trace.sampled if trace else random.random() < LOG_SAMPLE_RATE):
+        return
+    if not logger.isEnabledFor(levelno):
+        return
+    record = {"ts": round(time.time(), 3), "level": level, "event": event}
+    if trace:
+        record["request_id"] = trace.id
+    logger.log(levelno, json.dumps({**record, **fields}, ensure_ascii=False, default=str))
+
+
+class Span:
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def set(self, **fields) -> None:
+        self.fields.update(fields)
+
+
+@contextmanager
+def span(stage: str, name: str = "", **fields):
+    """Time a stage into the stage histogram, the request's Server-Timing and a sampled log line"""
+    current = Span(fields)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage, name).observe(duration)
+        trace = _request.get()
+        if trace:
+            trace.spans.append((stage, duration))
+        log("span", stage=stage, name=name, ms=round(duration * 1000, 2), **current.fields)
+
+
+def observe_payload(stage: str, name: str, size: int) -> None:
+    PAYLOAD_BYTES.labels(stage, name).observe(size)
+
+
+def count_tokens(usage: dict) -> None:
+    for kind in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.labels(kind.removesuffix("_tokens")).inc(usage[kind])
+
+
+def observe_request(method: str, route: str, status: int, duration: float) -> None:
+    REQUEST_SECONDS.labels(method, route, str(status)).observe(duration)
+
+
+def metrics() -> tuple:
+    """(body, content type) of the Prometheus exposition"""
+    registry = REGISTRY
+    # With several workers every process writes to PROMETHEUS_MULTIPROC_DIR and any of them can aggregate
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,98 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from .telemetry import log, span
+
+load_dotenv()
+
+
+class HistoryWriter:
+    """Write-behind queue for chat history.
+
+    Chats enqueue entries and return immediately; one background task drains the
+    queue and writes each batch as a single pipelined round trip.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.batch_size = int(os.getenv("HISTORY_BATCH_SIZE", "100"))
+        # How long a chat waits for room in a full queue before the entry is dropped
+        self.enqueue_timeout = float(os.getenv("HISTORY_ENQUEUE_TIMEOUT", "0.5"))
+        self.queue = asyncio.Queue(maxsize=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")))
+        self.task = None
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "overflows": 0, "dropped": 0, "errors": 0}
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def save(self, question: str, answer: str, id: str = None) -> asyncio.Future:
+        """Queue a history entry, waiting briefly for room when the writer is behind.
+
+        The returned future resolves to whether the entry reached Redis, for
+        readers that need it in the history rather than just queued.
+        """
+        written = asyncio.get_running_loop().create_future()
+        item = (self.store.history_key(id), self.store.new_entry(question, answer), written)
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.stats["overflows"] += 1
+            try:
+                await asyncio.wait_for(self.queue.put(item), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["dropped"] += 1
+                log("history_dropped", "warning", key=item[0])
+                written.set_result(False)
+                return written
+        self.stats["enqueued"] += 1
+        return written
+
+    async def run(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def write(self, batch: list) -> None:
+        # No MULTI here: this task is the only writer in the process and each
+        # queued command is atomic on its own
+        try:
+            with span("history_write", entries=len(batch)):
+                async with self.store.redis.pipeline(transaction=False) as pipe:
+                    for key, entry, _ in batch:
+                        self.store.queue_append(pipe, key, entry)
+                    results = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            self.stats["errors"] += len(batch)
+            log("history_write_failed", "error", entries=len(batch), error=str(e))
+            self.settle(batch, [e] * len(batch))
+            return
+        self.settle(batch, results)
+        failed = sum(isinstance(result, Exception) for result in results)
+        self.stats["errors"] += failed
+        self.stats["written"] += len(batch)
+        self.stats["batches"] += 1
+
+    @staticmethod
+    def settle(batch: list, results: list) -> None:
+        """Resolve the futures of a written batch to whether each entry was stored"""
+        for (_, _, written), result in zip(batch, results):
+            # Cancelled when nobody waits for it any more
+            if not written.done():
+                written.set_result(not isinstance(result, Exception))
+
+    async def close(self, timeout: float = 10) -> None:
+        """Flush what is queued, then stop the background task"""
+        if self.task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            log("history_unwritten", "warning", entries=self.queue.qsize())
+        self.task.cancel()
+        self.task = None